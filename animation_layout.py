@@ -0,0 +1,152 @@
+""" Module with node layout of graph animation, kept between runs,
+so only new nodes have to be placed and animated
+"""
+
+import json
+import os
+import random
+
+import numpy as np
+
+# File with node positions and sessions that were already animated
+# (defined with backends, so it can be removed without loading numpy)
+from visualization_backends import LAYOUT_FILE
+
+# Moving nodes are processed in blocks of this size to bound memory
+_BLOCK = 512
+
+
+class AnimationLayout:
+    """ Positions of graph nodes and names of already animated sessions.
+
+    New nodes start at the centre of their already placed neighbours and
+    are moved by force-directed layout (Fruchterman-Reingold), in which
+    old nodes stay fixed. So picture of old part of graph doesnt change,
+    and layout of one new session costs O(its nodes * all nodes).
+
+    Attributes:
+        positions (dict[str, list[float]]): node -> [x, y]
+        sessions (set[str]): sessions that were already animated
+
+    Example:
+    >>> layout = AnimationLayout()
+    >>> first = layout.place([("session_1", "a"), ("session_1", "b")])
+    >>> sorted(first)
+    ['a', 'b', 'session_1']
+    >>> second = layout.place([("session_1", "a"), ("session_1", "b"), ("session_2", "b")])
+    >>> all(second[node] == first[node] for node in first)
+    True
+    >>> sorted(set(second) - set(first))
+    ['session_2']
+    """
+    def __init__(self, positions: dict[str, list[float]] | None = None,
+                 sessions: set[str] | None = None):
+        self.positions = positions if positions is not None else {}
+        self.sessions = sessions if sessions is not None else set()
+
+    @classmethod
+    def load(cls, filename: str = LAYOUT_FILE) -> "AnimationLayout":
+        """ Read layout from file, empty layout if there is no file """
+        if not os.path.exists(filename):
+            return cls()
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["positions"], set(data["sessions"]))
+
+    def save(self, filename: str = LAYOUT_FILE):
+        """ Save layout to file (json), replacing it atomically """
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"positions": self.positions, "sessions": sorted(self.sessions)},
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, filename)
+
+    def place(self, edges: list[tuple[str, str]], iterations: int = 50,
+              seed: int = 0) -> dict[str, list[float]]:
+        """ Give position to every node of `edges` that doesnt have it yet
+
+        Args:
+            edges (list[tuple[str, str]]): edges of drawn graph
+            iterations (int, optional): steps of force-directed layout. Defaults to 50.
+            seed (int, optional): seed of initial jitter. Defaults to 0.
+
+        Returns:
+            dict[str, list[float]]: position of every node of `edges`
+        """
+        neighbours = {}
+        for start, end in edges:
+            neighbours.setdefault(start, []).append(end)
+            neighbours.setdefault(end, []).append(start)
+        new_nodes = [node for node in neighbours if node not in self.positions]
+        if new_nodes:
+            self._place_new(new_nodes, neighbours, iterations, random.Random(seed))
+        return {node: self.positions[node] for node in neighbours}
+
+    def _place_new(self, new_nodes: list[str], neighbours: dict[str, list[str]],
+                   iterations: int, rng: random.Random):
+        nodes = [node for node in neighbours if node in self.positions] + new_nodes
+        index = {node: i for i, node in enumerate(nodes)}
+        first_new = len(nodes) - len(new_nodes)
+        positions = np.zeros((len(nodes), 2))
+        for i, node in enumerate(nodes[:first_new]):
+            positions[i] = self.positions[node]
+
+        # Start next to placed neighbours, new nodes are placed one after another
+        placed = set(nodes[:first_new])
+        for node in new_nodes:
+            near = [index[other] for other in neighbours[node] if other in placed]
+            centre = positions[near].mean(axis=0) if near else (0.0, 0.0)
+            positions[index[node]] = centre + np.array([rng.uniform(-0.5, 0.5),
+                                                        rng.uniform(-0.5, 0.5)])
+            placed.add(node)
+
+        # Ideal distance between nodes
+        k = 1 / np.sqrt(len(nodes))
+        edge_starts = np.array([index[node] for node in new_nodes
+                                for _ in neighbours[node]], dtype=np.intp)
+        edge_ends = np.array([index[other] for node in new_nodes
+                              for other in neighbours[node]], dtype=np.intp)
+        temperature = 0.1
+        for _ in range(iterations):
+            moving = positions[first_new:]
+            shift = np.zeros_like(moving)
+            for block in range(0, len(moving), _BLOCK):
+                delta = moving[block:block + _BLOCK, None, :] - positions[None, :, :]
+                distance = np.maximum(np.linalg.norm(delta, axis=2), 0.01)
+                shift[block:block + _BLOCK] = \
+                    (delta * (k * k / distance ** 2)[:, :, None]).sum(axis=1)
+            delta = positions[edge_starts] - positions[edge_ends]
+            distance = np.maximum(np.linalg.norm(delta, axis=1), 0.01)
+            np.add.at(shift, edge_starts - first_new, -delta * (distance / k)[:, None])
+
+            length = np.maximum(np.linalg.norm(shift, axis=1), 1e-9)
+            positions[first_new:] += shift / length[:, None] \
+                * np.minimum(length, temperature)[:, None]
+            temperature *= 0.95
+
+        for node in new_nodes:
+            self.positions[node] = positions[index[node]].round(4).tolist()
+
+
+def fit_to_frame(positions: dict[str, list[float]], width: float = 12, height: float = 7
+                 ) -> dict[str, list[float]]:
+    """ Scale positions to fit into frame of given size around (0, 0),
+    as 3d points for Manim
+
+    Example:
+    >>> fit_to_frame({"a": [0, 0], "b": [2, 1]}, 4, 4)
+    {'a': [-2.0, -1.0, 0], 'b': [2.0, 1.0, 0]}
+    """
+    if not positions:
+        return {}
+    points = np.array(list(positions.values()), dtype=float)
+    centre = (points.max(axis=0) + points.min(axis=0)) / 2
+    size = np.maximum(points.max(axis=0) - points.min(axis=0), 1e-9)
+    scale = min(width / size[0], height / size[1])
+    return {node: [*((point - centre) * scale).tolist(), 0]
+            for node, point in zip(positions, points)}
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
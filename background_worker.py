@@ -0,0 +1,85 @@
+""" Module with background worker, so UI keeps handling input
+while recommendations are recomputed or graph is rendered
+"""
+
+import queue
+import threading
+
+
+class BackgroundWorker:
+    """ Thread that runs submitted tasks one by one, in order of submission.
+    Results are put into result queue and taken by UI thread with `poll`,
+    so UI state is changed only in UI thread and new results replace
+    old ones all at once.
+
+    Attributes:
+        pending (list[str]): kinds of submitted tasks that are not polled yet
+
+    Example:
+    >>> worker = BackgroundWorker()
+    >>> worker.submit("sum", sum, [1, 2, 3])
+    >>> worker.submit("number", int, "x")
+    >>> worker.busy
+    True
+    >>> worker.close()
+    >>> [(kind, result, type(error).__name__) for kind, result, error in worker.poll()]
+    [('sum', 6, 'NoneType'), ('number', None, 'ValueError')]
+    >>> worker.busy
+    False
+    """
+    def __init__(self):
+        self.pending = []
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="trapezna-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, function, *args, **kwargs):
+        """ Run `function(*args, **kwargs)` in worker thread after
+        all previously submitted tasks
+
+        Args:
+            kind (str): name of task, returned by `poll` with result
+            function (Callable): function to run
+        """
+        self.pending.append(kind)
+        self._tasks.put((kind, function, args, kwargs))
+
+    def _run(self):
+        while (task := self._tasks.get()) is not None:
+            kind, function, args, kwargs = task
+            try:
+                self._results.put((kind, function(*args, **kwargs), None))
+            except Exception as error:
+                self._results.put((kind, None, error))
+
+    def poll(self) -> list[tuple[str, object, Exception | None]]:
+        """ Return results of all tasks finished since last call, without waiting
+
+        Returns:
+            list[tuple[str, object, Exception | None]]: kind, result and
+                exception raised by task (None if it succeeded) of every task
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+            self.pending.remove(finished[-1][0])
+        return finished
+
+    @property
+    def busy(self) -> bool:
+        """ Check if some submitted task is not polled yet """
+        return bool(self.pending)
+
+    def close(self):
+        """ Wait until all submitted tasks are done and stop thread """
+        self._tasks.put(None)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
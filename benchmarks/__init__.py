@@ -0,0 +1,3 @@
+""" Benchmarks of recommendation logic on synthetic graphs and menus.
+Run with `python -m benchmarks --help`
+"""
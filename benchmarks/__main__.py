@@ -0,0 +1,202 @@
+""" Run benchmarks of recommendation pipeline on synthetic data
+
+Examples:
+    python -m benchmarks
+    python -m benchmarks --sessions 1000 100000 --dishes 50 5000
+    python -m benchmarks --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import graph_logic
+import dish_scoring
+import pagerank
+from benchmarks.generators import generate_menu, write_graph_json
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+RESULTS_FILE = "benchmark_results.json"
+# Fast stage is run several times in one sample, until sample takes this long,
+# so timer resolution and scheduler noise dont decide its time (seconds)
+MIN_SAMPLE_TIME = 0.02
+# Slowdown smaller than this is noise of machine, not regression (seconds)
+NOISE_FLOOR = 0.001
+
+
+def measure(function, repeat: int) -> tuple[float, int]:
+    """ Return best time of one run of `function` (seconds) among `repeat`
+    samples of at least `MIN_SAMPLE_TIME` and peak memory allocated
+    during one more run (bytes)
+    """
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    loops = max(1, int(MIN_SAMPLE_TIME / first)) if first else 1000
+
+    best = first
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        best = min(best, (time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def run_case(sessions: int, dishes: int, repeat: int, seed: int) -> list[dict]:
+    """ Measure every stage of pipeline on generated graph with `sessions`
+    sessions and menu with `dishes` dishes. Runs in temporary folder,
+    so files of real application are not touched.
+    """
+    import ui
+
+    results = []
+    old_folder = os.getcwd()
+    old_menu = graph_logic.FOOD_DATABASE_FILE
+    # Generated graph can take gigabytes, folder is removed after the case
+    with tempfile.TemporaryDirectory(prefix="trapezna_bench_") as folder:
+        os.chdir(folder)
+        try:
+            menu = generate_menu(dishes, dishes // 2 + 20, seed=seed)
+            with open("menu.json", "w", encoding="utf-8") as f:
+                json.dump(menu, f, ensure_ascii=False)
+            graph_logic.FOOD_DATABASE_FILE = os.path.join(folder, "menu.json")
+            write_graph_json("graph.json", menu, sessions, seed)
+            graph_file = os.path.join(folder, "graph.json")
+            bench_file = os.path.join(folder, "bench_graph.json")
+
+            graph = graph_logic.load_graph(graph_file)
+            products_power = graph_logic.calculate_products_power(graph)
+            dishes_power = graph_logic.calculate_dishes_power(products_power)
+            sorted_dishes = graph_logic.sort_dishes(dishes_power)
+            new_session = next(iter(graph.values()), ["product_0"])
+            personalized = pagerank.PersonalizedPageRank()
+            personalized.load(graph)
+
+            def add_and_save():
+                graph_logic.add_session(graph, new_session)
+                graph_logic.save_graph(graph, bench_file)
+                # Stage is run many times, graph of every run has the same size
+                graph.popitem()
+
+            ui.use_storage("jsonl")
+            typed_dishes = ui.get_sorted_dishes([], [])
+
+            stages = [
+                ("load_graph", sessions, lambda: graph_logic.load_graph(graph_file)),
+                ("add_session+save_graph", sessions, add_and_save),
+                ("calculate_products_power", sessions,
+                 lambda: graph_logic.calculate_products_power(graph)),
+                ("calculate_products_power(iter_graph_file)", sessions,
+                 lambda: graph_logic.calculate_products_power(
+                     graph_logic.iter_graph_file(graph_file))),
+                ("PersonalizedPageRank.run", sessions,
+                 lambda: personalized.run(new_session)),
+                ("calculate_dishes_power", dishes,
+                 lambda: graph_logic.calculate_dishes_power(products_power)),
+                ("dish_scoring.calculate_dishes_power", dishes,
+                 lambda: dish_scoring.calculate_dishes_power(products_power)),
+                ("sort_dishes", dishes, lambda: graph_logic.sort_dishes(dishes_power)),
+                ("divide_dishes_by_type", dishes,
+                 lambda: graph_logic.divide_dishes_by_type(sorted_dishes)),
+                ("get_sorted_dishes", dishes,
+                 lambda: ui.get_sorted_dishes([(0, 0)], typed_dishes)),
+            ]
+            for name, items, function in stages:
+                seconds, peak = measure(function, repeat)
+                results.append({
+                    "name": name, "sessions": sessions, "dishes": dishes,
+                    "seconds": seconds, "throughput": items / seconds if seconds else None,
+                    "peak_bytes": peak,
+                })
+        finally:
+            os.chdir(old_folder)
+            graph_logic.FOOD_DATABASE_FILE = old_menu
+    return results
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float,
+            noise_floor: float = NOISE_FLOOR) -> list[str]:
+    """ Return descriptions of stages that became slower than
+    `tolerance` times their baseline time and more than `noise_floor`
+    seconds slower, so microsecond stages dont fail on noise
+
+    Example:
+    >>> baseline = [{"name": "fast", "sessions": 1, "dishes": 1, "seconds": 0.00001},
+    ...             {"name": "slow", "sessions": 1, "dishes": 1, "seconds": 0.1}]
+    >>> compare([dict(result, seconds=result["seconds"] * 2) for result in baseline],
+    ...         baseline, 1.25)
+    ['slow (sessions=1, dishes=1): 0.200000s vs baseline 0.100000s']
+    """
+    baseline_times = {(result["name"], result["sessions"], result["dishes"]): result["seconds"]
+                      for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result["name"], result["sessions"], result["dishes"])
+        if key in baseline_times and result["seconds"] > baseline_times[key] * tolerance \
+                and result["seconds"] - baseline_times[key] > noise_floor:
+            regressions.append(f"{key[0]} (sessions={key[1]}, dishes={key[2]}): "
+                               f"{result['seconds']:.6f}s vs baseline {baseline_times[key]:.6f}s")
+    return regressions
+
+def print_results(results: list[dict]):
+    """ Print results as table """
+    print(f"{'stage':<44}{'sessions':>10}{'dishes':>8}{'seconds':>12}"
+          f"{'items/s':>14}{'peak MiB':>10}")
+    for result in results:
+        print(f"{result['name']:<44}{result['sessions']:>10}{result['dishes']:>8}"
+              f"{result['seconds']:>12.6f}{result['throughput'] or 0:>14.0f}"
+              f"{result['peak_bytes'] / 2 ** 20:>10.2f}")
+
+def main():
+    """ Parse arguments, run benchmarks, save and compare results """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="sizes of session history (default: 1000 10000 100000)")
+    parser.add_argument("--dishes", type=int, nargs="+", default=[50, 2000],
+                        help="sizes of menu (default: 50 2000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="samples of every stage, best is taken (default: 5)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generators")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to save results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="allowed slowdown against baseline (default: 1.25)")
+    parser.add_argument("--noise-floor", type=float, default=NOISE_FLOOR,
+                        help="smaller slowdown in seconds is not regression "
+                             f"(default: {NOISE_FLOOR})")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save results as new baseline")
+    args = parser.parse_args()
+
+    results = []
+    for dishes in args.dishes:
+        for sessions in args.sessions:
+            results.extend(run_case(sessions, dishes, args.repeat, args.seed))
+    print_results(results)
+
+    report = {"python": sys.version, "platform": platform.platform(), "results": results}
+    for filename in [args.output] + ([args.baseline] if args.save_baseline else []):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance,
+                                  args.noise_floor)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
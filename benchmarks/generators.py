@@ -0,0 +1,80 @@
+""" Module with seeded generators of synthetic menus and session histories """
+
+import json
+import random
+
+from graph_logic import Graph
+
+
+def generate_menu(dishes: int, products: int, types: int = 3, seed: int = 0,
+                  max_products_per_dish: int = 6) -> dict[str, dict[str, list[str]]]:
+    """ Generate menu in format of `menu.json`:
+    { type: { dish: [products] } }
+
+    Args:
+        dishes (int): number of dishes
+        products (int): number of different products
+        types (int, optional): number of dish types. Defaults to 3.
+        seed (int, optional): random seed. Defaults to 0.
+        max_products_per_dish (int, optional): Defaults to 6.
+
+    Returns:
+        dict[str, dict[str, list[str]]]: generated menu
+
+    Example:
+    >>> generate_menu(4, 10, 2, seed=1) == generate_menu(4, 10, 2, seed=1)
+    True
+    >>> [len(section) for section in generate_menu(4, 10, 2).values()]
+    [2, 2]
+    """
+    rng = random.Random(seed)
+    product_names = [f"product_{i}" for i in range(products)]
+    menu = {f"type_{i}": {} for i in range(types)}
+    for dish in range(dishes):
+        count = rng.randint(1, min(max_products_per_dish, products))
+        menu[f"type_{dish % types}"][f"dish_{dish}"] = rng.sample(product_names, count)
+    return menu
+
+def iter_sessions(menu: dict[str, dict[str, list[str]]], sessions: int, seed: int = 0,
+                  max_dishes_per_session: int = 4):
+    """ Generate sessions as user purchases of random dishes from `menu`.
+    Popular dishes are chosen more often (Zipf-like distribution).
+
+    Args:
+        menu (dict[str, dict[str, list[str]]]): menu to choose dishes from
+        sessions (int): number of sessions
+        seed (int, optional): random seed. Defaults to 0.
+        max_dishes_per_session (int, optional): Defaults to 4.
+
+    Yields:
+        tuple[str, list[str]]: name of session and its products
+    """
+    rng = random.Random(seed)
+    dishes = [products for section in menu.values() for products in section.values()]
+    weights = [1 / (rank + 1) for rank in range(len(dishes))]
+    for session in range(1, sessions + 1):
+        chosen = rng.choices(dishes, weights, k=rng.randint(1, max_dishes_per_session))
+        yield f"session_{session}", [product for products in chosen for product in products]
+
+def generate_graph(menu: dict[str, dict[str, list[str]]], sessions: int,
+                   seed: int = 0) -> Graph:
+    """ Generate graph with `sessions` sessions of purchases from `menu`
+
+    Example:
+    >>> graph = generate_graph(generate_menu(10, 20), 5)
+    >>> len(graph), list(graph)[0]
+    (5, 'session_1')
+    """
+    return dict(iter_sessions(menu, sessions, seed))
+
+def write_graph_json(filename: str, menu: dict[str, dict[str, list[str]]],
+                     sessions: int, seed: int = 0):
+    """ Write generated graph in format of `graph.json` directly to file,
+    without keeping it in memory (for histories of millions of sessions)
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("{")
+        for i, (session, products) in enumerate(iter_sessions(menu, sessions, seed)):
+            f.write(("," if i else "") + "\n    " + json.dumps(session) + ": "
+                    + json.dumps(products, ensure_ascii=False))
+        f.write("\n}")
@@ -0,0 +1,112 @@
+""" Measure import time of every main.py mode (like `python -X importtime`)
+
+Examples:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --save-baseline
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "startup_baseline.json")
+RESULTS_FILE = "startup_results.json"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py mode -> modules imported before mode does its work. Modules that
+# only some modes need are imported lazily by them (visualization backends,
+# see visualization_backends, service, snapshot and numpy rankings)
+MODES = {
+    "ui": ["main"],
+    "ui --ranking pagerank": ["main", "pagerank", "dish_scoring"],
+    "clear": ["main"],
+    "check_counts": ["main"],
+    "snapshot": ["main", "graph_snapshot"],
+    "serve": ["main", "asyncio", "recommendation_service"],
+    "visualization_png": ["main", "render_cache"],
+    "visualization": ["main", "graph_visualization_animation"],
+}
+
+
+def parse_importtime(output: str) -> tuple[int, int]:
+    """ Return total import time (microseconds) and number of imported
+    modules from stderr of `python -X importtime`
+
+    Example:
+    >>> parse_importtime('''import time: self [us] | cumulative | imported package
+    ... import time:        10 |         10 |   a
+    ... import time:         5 |         15 | b
+    ... import time:         7 |          7 | c''')
+    (22, 3)
+    """
+    total = modules = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules += 1
+        # Only top level imports, nested ones are included in their cumulative time
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, modules
+
+def measure(modules: list[str], repeat: int) -> dict:
+    """ Import `modules` in fresh interpreter `repeat` times,
+    return best import time or error if import failed
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                 cwd=ROOT, capture_output=True, text=True, check=False)
+        if process.returncode != 0:
+            return {"error": process.stderr.strip().splitlines()[-1]}
+        total, count = parse_importtime(process.stderr)
+        if best is None or total < best["microseconds"]:
+            best = {"microseconds": total, "modules": count}
+    return best
+
+def main():
+    """ Parse arguments, measure every mode, save and compare results """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every mode")
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to save results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed slowdown against baseline (default: 1.5)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="save results as new baseline")
+    args = parser.parse_args()
+
+    results = {mode: measure(modules, args.repeat) for mode, modules in MODES.items()}
+    print(f"{'mode':<24}{'ms':>10}{'modules':>10}")
+    for mode, result in results.items():
+        if "error" in result:
+            print(f"{mode:<24}  unavailable: {result['error']}")
+        else:
+            print(f"{mode:<24}{result['microseconds'] / 1000:>10.1f}{result['modules']:>10}")
+
+    for filename in [args.output] + ([args.baseline] if args.save_baseline else []):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=4)
+
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = [
+            f"{mode}: {result['microseconds'] / 1000:.1f}ms vs baseline "
+            f"{baseline[mode]['microseconds'] / 1000:.1f}ms"
+            for mode, result in results.items()
+            if "microseconds" in result and "microseconds" in baseline.get(mode, {})
+            and result["microseconds"] > baseline[mode]["microseconds"] * args.tolerance
+        ]
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
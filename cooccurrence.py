@@ -0,0 +1,123 @@
+""" Module with index of products ordered together ("also ordered") """
+
+import heapq
+
+from graph_logic import Graph, SessionStream, dishes_to_products, get_menu_index
+
+
+class CooccurrenceIndex:
+    """ Symmetric sparse table: how many sessions contain both products.
+    It is updated by every new session (the recommendation service keeps
+    one for "also" requests, see recommendation_service.py).
+
+    With `top_n`, every row keeps only about `top_n` most frequent neighbours:
+    when row grows to 2 * `top_n`, smaller counts are dropped. This keeps
+    memory and query time bounded, but dropped counts are lost,
+    so pruned index is approximate.
+
+    Attributes:
+        top_n (int | None): number of neighbours kept in every row
+        rows (dict[str, dict[str, int]]): product -> product -> count
+
+    Example:
+    >>> index = CooccurrenceIndex.from_graph({"session_1": ["a", "b", "c"], \
+"session_2": ["a", "b"], "session_3": ["c", "d"]})
+    >>> index.rows["a"]
+    {'b': 2, 'c': 1}
+    >>> index.query(["a"], 2)
+    [('b', 2), ('c', 1)]
+    >>> index.query(["a", "d"], 2)
+    [('b', 2), ('c', 2)]
+    """
+    def __init__(self, top_n: int | None = None):
+        self.top_n = top_n
+        self.rows = {}
+
+    @classmethod
+    def from_graph(cls, graph: Graph | SessionStream, top_n: int | None = None
+                   ) -> "CooccurrenceIndex":
+        """ Build index from all sessions of `graph`
+
+        Args:
+            graph (Graph | SessionStream): graph with sessions and products
+                connections, or stream of its sessions
+            top_n (int | None, optional): neighbours kept in every row.
+                Defaults to None (keep all).
+
+        Returns:
+            CooccurrenceIndex: built index
+        """
+        index = cls(top_n)
+        sessions = graph.items() if isinstance(graph, dict) else graph
+        for _, products in sessions:
+            index.add_session(products)
+        return index
+
+    def add_session(self, products: list[str]):
+        """ Count every pair of different products of new session once
+
+        Args:
+            products (list[str]): products from new session
+        """
+        products = list(dict.fromkeys(products))
+        for product in products:
+            row = self.rows.setdefault(product, {})
+            for other in products:
+                if other != product:
+                    row[other] = row.get(other, 0) + 1
+            if self.top_n is not None and len(row) >= 2 * self.top_n:
+                self.rows[product] = dict(heapq.nlargest(self.top_n, row.items(),
+                                                         key=lambda item: item[1]))
+
+    def query(self, products: list[str], n: int) -> list[tuple[str, int]]:
+        """ Return `n` products most often ordered together with `products`
+        (not including `products` themselves)
+
+        Args:
+            products (list[str]): current selection
+            n (int): number of products to return
+
+        Returns:
+            list[tuple[str, int]]: products and their total count, best first
+        """
+        # dict keeps order of `products`, so ties are broken deterministically
+        selected = dict.fromkeys(products)
+        counts = {}
+        for product in selected:
+            for other, count in self.rows.get(product, {}).items():
+                if other not in selected:
+                    counts[other] = counts.get(other, 0) + count
+        return heapq.nlargest(n, counts.items(), key=lambda item: item[1])
+
+    def also_ordered_dishes(self, dishes: list[str], n: int) -> list[str]:
+        """ Return `n` dishes whose products are most often ordered
+        together with products of selected `dishes` (selected not included)
+
+        Args:
+            dishes (list[str]): selected dishes
+            n (int): number of dishes to return
+
+        Returns:
+            list[str]: dishes, best first
+
+        Example:
+        >>> index = CooccurrenceIndex()
+        >>> index.add_session(["Броколі", "Ягоди"])
+        >>> index.also_ordered_dishes(["Крем суп з броколі"], 2)
+        ['Компот', 'Морс']
+        """
+        menu = get_menu_index()
+        selected = set(dishes)
+        products_power = dict(self.query(dishes_to_products(dishes), len(self.rows)))
+        dishes_power = {}
+        for product, power in products_power.items():
+            for dish in menu.product_dishes.get(product, ()):
+                if dish not in selected:
+                    dishes_power[dish] = dishes_power.get(dish, 0) + power
+        return [dish for dish, _ in heapq.nlargest(n, dishes_power.items(),
+                                                   key=lambda item: item[1])]
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
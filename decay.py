@@ -0,0 +1,171 @@
+""" Module with time-decayed products power: recent sessions
+count more than old ones (exponential decay with given half-life)
+"""
+
+import json
+import os
+
+from graph_logic import Graph
+
+# Default half-life of session weight - two weeks (in seconds)
+DEFAULT_HALF_LIFE = 14 * 24 * 60 * 60
+
+# When weight of new session gets bigger than this, weights are rescaled
+_MAX_EXPONENT = 64
+
+
+def calculate_decayed_products_power(graph: Graph, session_times: dict[str, float],
+                                     half_life: float, now: float) -> dict[str, float]:
+    """ Calculate power of all products, where every session counts
+    with weight 0.5 ** (age / `half_life`). Rescans whole graph,
+    `DecayedProductsPower` gives the same result incrementally.
+    Sessions without time are counted as made at time 0 (very old).
+
+    Args:
+        graph (Graph): graph with sessions and products connections
+        session_times (dict[str, float]): time of every session (unix time)
+        half_life (float): time after which session weight halves (seconds)
+        now (float): current time (unix time)
+
+    Returns:
+        dict[str, float]: dictionary where key is name of product
+            and value is decayed power of product
+
+    Example:
+    >>> graph = {"session_1": ["a", "b"], "session_2": ["b"]}
+    >>> calculate_decayed_products_power(graph, {"session_1": 0, "session_2": 10}, 10, 10)
+    {'a': 0.5, 'b': 1.5}
+    """
+    products_power = {}
+    for session, products in graph.items():
+        weight = 0.5 ** ((now - session_times.get(session, 0)) / half_life)
+        for product in products:
+            products_power[product] = products_power.get(product, 0) + weight
+    return products_power
+
+
+class DecayedProductsPower:
+    """ Time-decayed products power, updated by every session in O(session size).
+
+    Instead of decaying all weights when time goes, weight of new session
+    is scaled up by 2 ** ((time - reference_time) / half_life) and whole table
+    is scaled down only once when asking for power. When scale gets too big,
+    all weights are rescaled to new reference time (rare, O(number of products)).
+
+    Attributes:
+        half_life (float): time after which session weight halves (seconds)
+        reference_time (float): time at which stored weights are exact
+        weights (dict[str, float]): product -> weight at `reference_time`
+        sessions (int): number of added sessions
+        position (int): position of storage after last added session.
+            Sessions of storage after it are not counted yet
+            (see `SessionStore.iter_sessions_after`, `ui.load_decayed_power`)
+
+    Example:
+    >>> power = DecayedProductsPower(half_life=10)
+    >>> power.add_session(["a", "b"], 0)
+    >>> power.add_session(["b"], 10)
+    >>> power.power(10), power.sessions
+    ({'a': 0.5, 'b': 1.5}, 2)
+    >>> power.power(20)
+    {'a': 0.25, 'b': 0.75}
+    """
+    def __init__(self, half_life: float = DEFAULT_HALF_LIFE, reference_time: float = 0,
+                 weights: dict[str, float] | None = None, sessions: int = 0,
+                 position: int = 0):
+        self.half_life = half_life
+        self.reference_time = reference_time
+        self.weights = weights if weights is not None else {}
+        self.sessions = sessions
+        self.position = position
+
+    def _rescale(self, reference_time: float):
+        scale = 2 ** ((self.reference_time - reference_time) / self.half_life)
+        for product in self.weights:
+            self.weights[product] *= scale
+        self.reference_time = reference_time
+
+    def add_session(self, products: list[str], timestamp: float):
+        """ Add session with `products` made at `timestamp`
+
+        Args:
+            products (list[str]): products from new session
+            timestamp (float): time of session (unix time)
+        """
+        if not self.weights:
+            self.reference_time = timestamp
+        exponent = (timestamp - self.reference_time) / self.half_life
+        if exponent > _MAX_EXPONENT:
+            self._rescale(timestamp)
+            exponent = 0
+        weight = 2 ** exponent
+        for product in products:
+            self.weights[product] = self.weights.get(product, 0) + weight
+        self.sessions += 1
+
+    def power(self, now: float) -> dict[str, float]:
+        """ Return decayed power of all products at time `now`
+
+        Args:
+            now (float): current time (unix time)
+
+        Returns:
+            dict[str, float]: dictionary where key is name of product
+                and value is decayed power of product
+        """
+        scale = 2 ** ((self.reference_time - now) / self.half_life)
+        return {product: weight * scale for product, weight in self.weights.items()}
+
+    @classmethod
+    def from_graph(cls, graph: Graph, session_times: dict[str, float],
+                   half_life: float = DEFAULT_HALF_LIFE) -> "DecayedProductsPower":
+        """ Build decayed power from all sessions of `graph`
+
+        Args:
+            graph (Graph): graph with sessions and products connections
+            session_times (dict[str, float]): time of every session (unix time)
+            half_life (float, optional): half-life of session weight (seconds)
+
+        Returns:
+            DecayedProductsPower: decayed power of all sessions
+        """
+        decayed = cls(half_life)
+        for session in sorted(graph, key=lambda session: session_times.get(session, 0)):
+            decayed.add_session(graph[session], session_times.get(session, 0))
+        return decayed
+
+    def save(self, filename: str):
+        """ Save decayed power to file (json), replacing it atomically
+
+        Args:
+            filename (str): name of destination file (json)
+        """
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"half_life": self.half_life, "reference_time": self.reference_time,
+                       "sessions": self.sessions, "position": self.position,
+                       "weights": self.weights},
+                      f, ensure_ascii=False)
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename: str) -> "DecayedProductsPower":
+        """ Read decayed power from file `filename` (json)
+
+        Args:
+            filename (str): name of file with decayed power (json)
+
+        Returns:
+            DecayedProductsPower: loaded decayed power. Files saved before
+                number of sessions or position was kept have `sessions`
+                or `position` = -1
+        """
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["half_life"], data["reference_time"], data["weights"],
+                   data.get("sessions", -1), data.get("position", -1))
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
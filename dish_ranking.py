@@ -0,0 +1,93 @@
+""" Module with dish ranking that is updated by sessions incrementally """
+
+from bisect import bisect_left, insort
+from collections.abc import Sequence
+
+from graph_logic import get_menu_index, calculate_dishes_power
+
+
+class RankedDishesView(Sequence):
+    """ Read-only view of dishes of one type in `DishRanking`
+    (sorted by power), without copying them into new list
+    """
+    def __init__(self, keys: list[tuple[int, int, str]]):
+        self._keys = keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [key[2] for key in self._keys[index]]
+        return self._keys[index][2]
+
+
+class DishRanking:
+    """ Dishes of every type ordered by power, which can be updated
+    by new session. Session changes power only of its products, so only
+    dishes with them are moved, using index product -> dishes of menu.
+    Cost of one session is proportional to its size, not to size of menu.
+
+    Order is the same as `divide_dishes_by_type(sort_dishes(...))`:
+    by power, dishes with equal power keep order of menu.
+
+    Attributes:
+        menu (MenuIndex): menu used to build ranking
+        dishes_power (dict[str, int]): current power of every dish
+
+    Example:
+    >>> ranking = DishRanking({"Картопля": 1})
+    >>> ranking.typed_dishes()[0][:2]
+    ['Борщ з мʼясом', 'Суп грибний']
+    >>> ranking.apply_session(["Броколі", "Броколі"])
+    >>> ranking.typed_dishes()[0][:2]
+    ['Овочевий суп', 'Крем суп з броколі']
+    """
+    def __init__(self, products_power: dict[str, int]):
+        self.menu = get_menu_index()
+        self.dishes_power = calculate_dishes_power(products_power)
+        # Position of dish in menu, to keep order of dishes with equal power
+        self._position = {dish: i for i, dish in enumerate(self.menu.dish_type)}
+        # Sorted keys (-power, position, dish) of every type
+        self._typed_keys = {
+            dish_type: sorted(self._key(dish) for dish in dishes)
+            for dish_type, dishes in self.menu.type_dishes.items()
+        }
+
+    def _key(self, dish: str) -> tuple[int, int, str]:
+        return (-self.dishes_power[dish], self._position[dish], dish)
+
+    def apply_session(self, products: list[str]):
+        """ Update ranking with one new session (same as each product
+        of `products` got +1 to its power)
+
+        Args:
+            products (list[str]): products from new session
+        """
+        products_delta = {}
+        for product in products:
+            products_delta[product] = products_delta.get(product, 0) + 1
+
+        dishes_delta = {}
+        for product, delta in products_delta.items():
+            for dish in self.menu.product_dishes.get(product, ()):
+                dishes_delta[dish] = dishes_delta.get(dish, 0) + delta
+
+        for dish, delta in dishes_delta.items():
+            keys = self._typed_keys[self.menu.dish_type[dish]]
+            del keys[bisect_left(keys, self._key(dish))]
+            self.dishes_power[dish] += delta
+            insort(keys, self._key(dish))
+
+    def typed_dishes(self) -> tuple[RankedDishesView, ...]:
+        """ Return sorted dishes divided by type
+
+        Returns:
+            tuple[RankedDishesView, ...]: sorted dishes of every type
+        """
+        return tuple(RankedDishesView(keys) for keys in self._typed_keys.values())
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -0,0 +1,196 @@
+""" Module with vectorised (numpy) calculation of dishes power """
+
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+import numpy as np
+
+from graph_logic import MenuIndex, get_menu_index
+
+
+class DishScorer:
+    """ Sparse dish×product incidence matrix of menu.
+    Row of dish has 1 in columns of all its products.
+    Matrix is stored in CSR form (`indptr`, `indices`), so product
+    of matrix with vector of products power is done by one
+    `np.add.reduceat` call over rows, in dtype of the vector
+    (integer powers are summed exactly, without going through float).
+
+    Example:
+    >>> scorer = DishScorer(MenuIndex({"Супи": {"Борщ": ["Буряк", "Картопля"], \
+"Суп": ["Картопля"], "Вода": []}}))
+    >>> scorer.score(scorer.vector({"Картопля": 2, "Буряк": 1}))
+    array([3, 2, 0])
+    >>> big = 2 ** 60 + 1
+    >>> scorer.score(scorer.vector({"Картопля": big, "Буряк": 1})).tolist() == [big + 1, big, 0]
+    True
+    """
+    def __init__(self, menu: MenuIndex):
+        self.dishes = menu.dish_ids.names
+        self.products = menu.product_ids.ids
+
+        indptr = [0]
+        indices = []
+        for dish in self.dishes:
+            indices.extend(sorted(self.products[product]
+                                  for product in menu.dish_product_set[dish]))
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        # Dishes without products are skipped by reduceat and stay 0
+        self.has_products = np.diff(self.indptr) > 0
+        self.starts = self.indptr[:-1][self.has_products]
+
+    def vector(self, products_power: dict[str, int]) -> np.ndarray:
+        """ Convert `products_power` into vector of products power.
+        Products that are not in menu are skipped.
+
+        Args:
+            products_power (dict[str, int]): dictionary where
+                key is name of product and value is its power.
+
+        Returns:
+            np.ndarray: vector of power of every product of menu
+        """
+        is_int = all(isinstance(power, int) for power in products_power.values())
+        weights = np.zeros(len(self.products), dtype=np.int64 if is_int else np.float64)
+        for product, power in products_power.items():
+            if product in self.products:
+                weights[self.products[product]] = power
+        return weights
+
+    def score(self, weights: np.ndarray) -> np.ndarray:
+        """ Calculate power of every dish as product of incidence
+        matrix and vector of products power `weights`
+
+        Args:
+            weights (np.ndarray): vector of products power (see `vector`)
+
+        Returns:
+            np.ndarray: power of every dish in order of `dishes`
+        """
+        scores = np.zeros(len(self.dishes), dtype=weights.dtype)
+        if len(self.starts):
+            scores[self.has_products] = np.add.reduceat(weights[self.indices], self.starts)
+        return scores
+
+    def matrix(self, profiles: list[dict[str, int]]) -> np.ndarray:
+        """ Stack products power of several profiles into matrix
+        (row - profile, column - product of menu)
+
+        Args:
+            profiles (list[dict[str, int]]): products power of every profile
+
+        Returns:
+            np.ndarray: matrix of products power
+        """
+        is_int = all(isinstance(power, int)
+                     for products_power in profiles for power in products_power.values())
+        weights = np.zeros((len(profiles), len(self.products)),
+                           dtype=np.int64 if is_int else np.float64)
+        for row, products_power in enumerate(profiles):
+            for product, power in products_power.items():
+                if product in self.products:
+                    weights[row, self.products[product]] = power
+        return weights
+
+    def score_matrix(self, weights: np.ndarray) -> np.ndarray:
+        """ Calculate power of every dish for every profile at once,
+        as product of matrix of products power and transposed incidence matrix
+
+        Args:
+            weights (np.ndarray): matrix of products power (see `matrix`)
+
+        Returns:
+            np.ndarray: matrix of dishes power (row - profile, column - dish)
+        """
+        scores = np.zeros((weights.shape[0], len(self.dishes)), dtype=weights.dtype)
+        # Sum of columns of products of every dish
+        if len(self.starts):
+            scores[:, self.has_products] = np.add.reduceat(weights[:, self.indices],
+                                                           self.starts, axis=1)
+        return scores
+
+# (menu index, scorer built from it)
+_scorer_cache: tuple[MenuIndex, DishScorer] | None = None
+
+def get_dish_scorer() -> DishScorer:
+    """ Return `DishScorer` of current menu.
+    Scorer is built only once per version of `MenuIndex`.
+
+    Returns:
+        DishScorer: scorer of current menu
+    """
+    global _scorer_cache
+    menu = get_menu_index()
+    if _scorer_cache is None or _scorer_cache[0] is not menu:
+        _scorer_cache = (menu, DishScorer(menu))
+    return _scorer_cache[1]
+
+def calculate_dishes_power(products_power: dict[str, int]) -> dict[str, int]:
+    """ Calculate power of all dishes with one sparse matrix-vector product.
+    Gives the same result as `graph_logic.calculate_dishes_power`
+    (for float powers - up to rounding of addition order).
+
+    Args:
+        products_power (dict[str, int]): dictionary where
+            key is name of product and value is its power.
+
+    Returns:
+        dict[str, int]: dictionary where key is name of dish
+            and value is dishes power
+
+    Example:
+    >>> import graph_logic
+    >>> products_power = {"Броколі":1, "Картопля":10, "Буряк":3}
+    >>> calculate_dishes_power(products_power) == \
+graph_logic.calculate_dishes_power(products_power)
+    True
+    """
+    scorer = get_dish_scorer()
+    scores = scorer.score(scorer.vector(products_power))
+    return dict(zip(scorer.dishes, scores.tolist()))
+
+
+def score_profiles(profiles: Iterable[dict[str, int]], k: int, chunk_size: int = 1024
+                   ) -> Iterator[list[tuple[list[str], ...]]]:
+    """ Find best `k` dishes of every type for many profiles (products power
+    of customers). Profiles are scored by chunks of `chunk_size` with one
+    matrix product per chunk, so memory doesnt depend on number of profiles.
+
+    Args:
+        profiles (Iterable[dict[str, int]]): products power of every profile
+        k (int): number of best dishes of every type
+        chunk_size (int, optional): profiles scored at once. Defaults to 1024.
+
+    Yields:
+        list[tuple[list[str], ...]]: for every profile of chunk - best dishes
+            of every type, in the same order as `top_dishes_by_type`
+
+    Example:
+    >>> import graph_logic
+    >>> profiles = [{"Броколі": 1, "Картопля": 10}, {"Ягоди": 2}, {}]
+    >>> results = [result for chunk in score_profiles(profiles, 3, chunk_size=2) \
+for result in chunk]
+    >>> results == [tuple(list(dishes[:3]) for dishes in graph_logic.top_dishes_by_type(\
+graph_logic.calculate_dishes_power(profile), 3)) for profile in profiles]
+    True
+    """
+    scorer = get_dish_scorer()
+    menu = get_menu_index()
+    type_columns = [np.array([menu.dish_ids.ids[dish] for dish in dishes], dtype=np.int64)
+                    for dishes in menu.type_dishes.values()]
+    profiles = iter(profiles)
+    while chunk := list(islice(profiles, chunk_size)):
+        scores = scorer.score_matrix(scorer.matrix(chunk))
+        typed_best = []
+        for columns in type_columns:
+            # Stable sort keeps menu order of dishes with equal power
+            best = columns[np.argsort(-scores[:, columns], axis=1, kind="stable")[:, :k]]
+            typed_best.append(best)
+        yield [tuple([scorer.dishes[dish] for dish in best[row]] for best in typed_best)
+               for row in range(len(chunk))]
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -1,10 +1,20 @@
 """ Module with main graph and recommendation logic """
 
+import heapq
 import json
+import os
+import re
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
 from typing import NewType
+
+from interning import Interner, CompactGraph
 # Just create new type shortcut called "Graph"
 # So when you use "Graph", python understand it as "dict[str, list[str]]"
 Graph = NewType("Graph", dict[str, list[str]])
+# Sessions one by one, as pairs (session, products) - like `Graph.items()`,
+# but without keeping all of them in memory
+SessionStream = Iterable[tuple[str, list[str]]]
 
 
 # Mariia
@@ -42,7 +52,113 @@ def load_graph(filename: str) -> Graph:
             f.write("{\n}")
         return {}
 
-def add_session(graph: Graph, products: list[str]):
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Longest json value (characters) that is buffered while it is being decoded,
+# so broken file (e.g. unclosed string) is not read into memory whole
+MAX_JSON_VALUE_SIZE = 2 ** 24
+
+class _JsonStreamReader:
+    """ Reads json text from file by chunks, so values can be decoded
+    one by one without reading whole file
+
+    Example:
+    >>> import io
+    >>> reader = _JsonStreamReader(io.StringIO('["a", "b"] "unclosed' + " " * 100), 8, 64)
+    >>> reader.decode()
+    ['a', 'b']
+    >>> reader.decode()
+    Traceback (most recent call last):
+        ...
+    json.decoder.JSONDecodeError: Value is longer than 64 characters: line 1 column 1 (char 0)
+    """
+    def __init__(self, file, chunk_size: int, max_value_size: int = MAX_JSON_VALUE_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.buffer = ""
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def _read_more(self) -> bool:
+        """ Read next chunk, return False at end of file """
+        chunk = self.file.read(self.chunk_size)
+        # Drop already decoded text, so buffer holds only about one value
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    def next_char(self) -> str:
+        """ Skip whitespace and return next character ("" at end of file) """
+        while True:
+            self.position = _WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self._read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, char: str):
+        """ Skip `char` (after whitespace) or raise json.JSONDecodeError """
+        if self.next_char() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buffer, self.position)
+        self.position += 1
+
+    def decode(self):
+        """ Decode next json value, reading more chunks if it is cut.
+        Raises json.JSONDecodeError if value is still broken after
+        `max_value_size` characters.
+        """
+        self.next_char()
+        while True:
+            try:
+                value, self.position = self.decoder.raw_decode(self.buffer, self.position)
+                return value
+            except json.JSONDecodeError:
+                if len(self.buffer) - self.position > self.max_value_size:
+                    raise json.JSONDecodeError(
+                        f"Value is longer than {self.max_value_size} characters",
+                        self.buffer, self.position) from None
+                if not self._read_more():
+                    raise
+
+def iter_graph_file(filename: str, chunk_size: int = 2 ** 16) -> Iterator[tuple[str, list[str]]]:
+    """ Read graph from file `filename` (json) session by session.
+    File is parsed incrementally, so memory doesnt depend on its size
+    (only on size of the biggest session).
+
+    Args:
+        filename (str): name of file with graph (json)
+        chunk_size (int, optional): number of characters read at once.
+            Defaults to 2 ** 16.
+
+    Yields:
+        tuple[str, list[str]]: name of session and its products
+
+    Examples:
+    >>> import tempfile
+    >>> graph_file = os.path.join(tempfile.mkdtemp(), "graph.json")
+    >>> save_graph({"session_1": ["product_1", "product_2"], "session_2": []}, graph_file)
+    >>> list(iter_graph_file(graph_file, chunk_size=3))
+    [('session_1', ['product_1', 'product_2']), ('session_2', [])]
+    >>> list(iter_graph_file(os.path.join(tempfile.mkdtemp(), "missing.json")))
+    []
+    """
+    try:
+        f = open(filename, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        reader = _JsonStreamReader(f, chunk_size)
+        reader.expect("{")
+        if reader.next_char() == "}":
+            return
+        while True:
+            session = reader.decode()
+            reader.expect(":")
+            yield session, reader.decode()
+            if reader.next_char() == "}":
+                return
+            reader.expect(",")
+
+def add_session(graph: Graph | CompactGraph, products: list[str] | array,
+                products_power: dict[str, int] | None = None):
     """ Modify `graph` by adding session with `products` to it
 
     Session format:
@@ -53,8 +169,12 @@ def add_session(graph: Graph, products: list[str]):
     `"session_2" : ["product_7", "product_9"]`
 
     Args:
-        graph (Graph): graph to modify
-        products (list[str]): products from new session
+        graph (Graph | CompactGraph): graph to modify
+        products (list[str] | array): products from new session
+            (for `CompactGraph` can be array of product ids)
+        products_power (dict[str, int] | None, optional): aggregated
+            products power of `graph`. If given, it is updated
+            incrementally with `products`. Defaults to None.
 
     Examples:
     >>> add_session({}, ["product_1", "product_4", "product_3", "product_2", "product_9"])
@@ -64,11 +184,277 @@ def add_session(graph: Graph, products: list[str]):
  ["product_10", "product_45", "product_33", "product_26", "product_9"])
     {'session_1': ['product_1', 'product_4', 'product_3', 'product_2', 'product_9'], 'session_2':\
  ['product_10', 'product_45', 'product_33', 'product_26', 'product_9']}
+    >>> products_power = {'product_1': 1}
+    >>> _ = add_session({'session_1': ['product_1']}, ['product_1', 'product_2'], products_power)
+    >>> products_power
+    {'product_1': 2, 'product_2': 1}
+    >>> add_session(CompactGraph(), ["product_1", "product_2"]).to_graph()
+    {'session_1': ['product_1', 'product_2']}
+    """
+    if isinstance(graph, CompactGraph):
+        graph.add_session(products)
+        if products_power is not None and isinstance(products, array):
+            products = [graph.products.name(product) for product in products]
+    else:
+        num_of_sess = len(graph)
+        graph[f'session_{num_of_sess+1}'] = products
+    if products_power is not None:
+        update_products_power(products_power, products)
+    return graph
+
+def append_session_record(session: str, products: list[str], filename: str,
+                          timestamp: float | None = None):
+    """ Append one session record to session log `filename` (json lines)
+
+    Log format (one session per line):
+    `{"session": "session_2", "products": ["product_7", "product_9"], "time": 1733300000.0}`
+
+    Args:
+        session (str): name of session
+        products (list[str]): products from session
+        filename (str): name of session log file (jsonl)
+        timestamp (float | None, optional): time of session (unix time).
+            Defaults to None (time is not saved).
     """
-    num_of_sess = len(graph)
-    graph[f'session_{num_of_sess+1}'] = products
+    record = {"session": session, "products": products}
+    if timestamp is not None:
+        record["time"] = timestamp
+    with open(filename, 'a', encoding='utf-8') as f:
+        # One write call per record, so record is never split between writes
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def append_session(graph: Graph, products: list[str], filename: str,
+                   products_power: dict[str, int] | None = None) -> Graph:
+    """ Add session with `products` to `graph` (same as `add_session`)
+    and append only this new session to session log `filename` (json lines)
+
+    Unlike `save_graph`, this doesnt rewrite whole file, so
+    cost of one purchase doesnt depend on number of stored sessions.
+
+    Args:
+        graph (Graph): graph to modify
+        products (list[str]): products from new session
+        filename (str): name of session log file (jsonl)
+        products_power (dict[str, int] | None, optional): aggregated
+            products power to update. Defaults to None.
+
+    Returns:
+        Graph: modified graph
+
+    Examples:
+    >>> import tempfile
+    >>> log_file = os.path.join(tempfile.mkdtemp(), "graph.jsonl")
+    >>> graph = append_session({}, ["product_1", "product_2"], log_file)
+    >>> graph = append_session(graph, ["product_7"], log_file)
+    >>> load_session_log(log_file)
+    {'session_1': ['product_1', 'product_2'], 'session_2': ['product_7']}
+    """
+    add_session(graph, products, products_power)
+    append_session_record(f"session_{len(graph)}", products, filename)
     return graph
 
+def load_session_log(filename: str, session_times: dict[str, float] | None = None
+                     ) -> Graph:
+    """ Read session log `filename` (json lines) and rebuild graph from it
+
+    Args:
+        filename (str): name of session log file (jsonl)
+        session_times (dict[str, float] | None, optional): if given, it is
+            filled with time of every session that has it. Defaults to None.
+
+    Returns:
+        Graph: graph with all sessions from log
+
+    Examples:
+    >>> import tempfile
+    >>> log_file = os.path.join(tempfile.mkdtemp(), "graph.jsonl")
+    >>> append_session_record("session_1", ["product_1"], log_file, 100.0)
+    >>> append_session_record("session_2", ["product_2"], log_file)
+    >>> session_times = {}
+    >>> load_session_log(log_file, session_times), session_times
+    ({'session_1': ['product_1'], 'session_2': ['product_2']}, {'session_1': 100.0})
+    """
+    if not os.path.exists(filename):
+        with open(filename, 'w', encoding='utf-8'):
+            pass
+    return dict(iter_session_log(filename, session_times))
+
+def iter_session_log(filename: str, session_times: dict[str, float] | None = None
+                     ) -> Iterator[tuple[str, list[str]]]:
+    """ Read session log `filename` (json lines) line by line
+
+    Args:
+        filename (str): name of session log file (jsonl)
+        session_times (dict[str, float] | None, optional): if given, it is
+            filled with time of every session that has it. Defaults to None.
+
+    Yields:
+        tuple[str, list[str]]: name of session and its products
+    """
+    for session, products, _ in iter_session_records(filename, session_times):
+        yield session, products
+
+def iter_session_records(filename: str, session_times: dict[str, float] | None = None,
+                         offset: int = 0) -> Iterator[tuple[str, list[str], int]]:
+    """ Read records of session log `filename` (json lines) starting from
+    byte `offset`, so records read before are skipped without reading
+    them. Last record without newline is being written now (or was cut
+    by crash), it is left for next read.
+
+    Args:
+        filename (str): name of session log file (jsonl)
+        session_times (dict[str, float] | None, optional): if given, it is
+            filled with time of every session that has it. Defaults to None.
+        offset (int, optional): position in file after some record
+            (given by previous read). Defaults to 0.
+
+    Yields:
+        tuple[str, list[str], int]: name of session, its products and
+            offset after its record
+
+    Examples:
+    >>> import tempfile
+    >>> log_file = os.path.join(tempfile.mkdtemp(), "graph.jsonl")
+    >>> for i in range(1, 4):
+    ...     append_session_record(f"session_{i}", [f"product_{i}"], log_file, float(i))
+    >>> offset = list(iter_session_records(log_file))[1][2]
+    >>> with open(log_file, "a", encoding="utf-8") as f:
+    ...     _ = f.write('{"session": "session_4", "produ')
+    >>> session_times = {}
+    >>> [record[:2] for record in iter_session_records(log_file, session_times, offset)]
+    [('session_3', ['product_3'])]
+    >>> session_times
+    {'session_3': 3.0}
+    """
+    try:
+        f = open(filename, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Record was cut by crash in the middle of write, skip it
+                continue
+            if session_times is not None and "time" in record:
+                session_times[record["session"]] = record["time"]
+            yield record["session"], record["products"], offset
+
+def session_log_end(filename: str, block_size: int = 2 ** 16) -> int:
+    """ Return offset after last complete record of session log `filename`
+    (0 if there is none), reading only its end. Reading records from it
+    later gives only records appended after this call.
+
+    Example:
+    >>> import tempfile
+    >>> log_file = os.path.join(tempfile.mkdtemp(), "graph.jsonl")
+    >>> append_session_record("session_1", ["product_1"], log_file)
+    >>> end = session_log_end(log_file)
+    >>> with open(log_file, "a", encoding="utf-8") as f:
+    ...     _ = f.write('{"session": "session_2", "produ')
+    >>> session_log_end(log_file, block_size=4) == end == os.path.getsize(log_file) - 31
+    True
+    """
+    try:
+        f = open(filename, "rb")
+    except FileNotFoundError:
+        return 0
+    with f:
+        end = f.seek(0, 2)
+        while end > 0:
+            start = max(end - block_size, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+def last_session_name(filename: str, block_size: int = 2 ** 16) -> str | None:
+    """ Return name of last complete session record of session log
+    `filename`, reading only its end. None if log has no records.
+
+    Args:
+        filename (str): name of session log file (jsonl)
+        block_size (int, optional): bytes read from end of file at once.
+            Defaults to 2 ** 16.
+
+    Examples:
+    >>> import tempfile
+    >>> log_file = os.path.join(tempfile.mkdtemp(), "graph.jsonl")
+    >>> last_session_name(log_file) is None
+    True
+    >>> append_session_record("session_1", ["product_1"], log_file)
+    >>> append_session_record("session_2", ["product_2"] * 10, log_file)
+    >>> with open(log_file, "a", encoding="utf-8") as f:
+    ...     _ = f.write('{"session": "session_3", "produ')
+    >>> last_session_name(log_file, block_size=16)
+    'session_2'
+    """
+    try:
+        f = open(filename, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        end = f.seek(0, 2)
+        tail = b""
+        while end > 0:
+            start = max(end - block_size, 0)
+            f.seek(start)
+            tail = f.read(end - start) + tail
+            end = start
+            # Last line is complete only if newline before it was read too
+            lines = tail.split(b"\n")
+            for line in reversed(lines[1:] if end > 0 else lines):
+                try:
+                    return json.loads(line)["session"]
+                except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+                    # Empty line or record cut by crash in the middle of write
+                    continue
+            tail = lines[0] if end > 0 else b""
+    return None
+
+def migrate_graph_to_log(graph_file: str, log_file: str) -> int:
+    """ Convert graph from old `graph_file` (json) into session log `log_file`
+    (json lines). Old file stays untouched, so it can be used as backup.
+    Graph is streamed (see `iter_graph_file`), so it is never loaded whole.
+
+    Args:
+        graph_file (str): name of file with graph (json)
+        log_file (str): name of destination session log file (jsonl)
+
+    Returns:
+        int: number of migrated sessions
+
+    Examples:
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> save_graph({"session_1": ["product_1"], "session_2": ["product_2"]}, \
+os.path.join(folder, "graph.json"))
+    >>> migrate_graph_to_log(os.path.join(folder, "graph.json"), \
+os.path.join(folder, "graph.jsonl"))
+    2
+    >>> load_session_log(os.path.join(folder, "graph.jsonl"))
+    {'session_1': ['product_1'], 'session_2': ['product_2']}
+    """
+    sessions = 0
+    # Write to temporary file first, so half-migrated log never appears
+    tmp_file = log_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for session, products in iter_graph_file(graph_file):
+            record = {"session": session, "products": products}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sessions += 1
+    os.replace(tmp_file, log_file)
+    return sessions
+
 # Path to database(just json) with all dishes
 # and information about each dish
 FOOD_DATABASE_FILE = 'menu.json'
@@ -104,6 +490,71 @@ def structure_menu(menu: dict[dict[str]]) -> dict[str]:
             new_menu[dish] = (dish_type, menu[dish_type][dish])
     return new_menu
 
+class MenuIndex:
+    """ Menu from json file, indexed for fast lookups.
+    Built once per file version, see `get_menu_index`.
+
+    Attributes:
+        dish_type (dict[str, str]): dish -> its type
+        dish_products (dict[str, list[str]]): dish -> products as in menu
+        dish_product_set (dict[str, frozenset[str]]): dish -> set of products
+        type_dishes (dict[str, list[str]]): type -> dishes in menu order
+        product_dishes (dict[str, list[str]]): product -> dishes with it
+        dish_ids (Interner): integer ids of dishes (in menu order)
+        product_ids (Interner): integer ids of products
+
+    Example:
+    >>> index = MenuIndex({"Супи": {"Борщ": ["Буряк", "Картопля"]}, \
+"Напої": {"Узвар": ["Ягоди"]}})
+    >>> index.dish_type["Узвар"], index.type_dishes["Супи"], index.product_dishes["Буряк"]
+    ('Напої', ['Борщ'], ['Борщ'])
+    """
+    def __init__(self, menu: dict[str, dict[str, list[str]]]):
+        self.dish_type = {}
+        self.dish_products = {}
+        self.dish_product_set = {}
+        self.type_dishes = {}
+        self.product_dishes = {}
+        for dish, (dish_type, products) in structure_menu(menu).items():
+            self.dish_type[dish] = dish_type
+            self.dish_products[dish] = products
+            self.dish_product_set[dish] = frozenset(products)
+        for dish_type in menu:
+            self.type_dishes[dish_type] = [dish for dish in menu[dish_type]
+                                           if self.dish_type[dish] == dish_type]
+        for dish, products in self.dish_product_set.items():
+            for product in products:
+                self.product_dishes.setdefault(product, []).append(dish)
+        self.dish_ids = Interner(self.dish_type)
+        self.product_ids = Interner(self.product_dishes)
+
+# file name -> (modification time of file, index of it)
+_menu_index_cache: dict[str, tuple[int, MenuIndex]] = {}
+
+def get_menu_index(filename: str | None = None) -> MenuIndex:
+    """ Return `MenuIndex` of menu file `filename`.
+    File is parsed only once and again only after it was modified.
+
+    Args:
+        filename (str | None, optional): name of menu file (json).
+            Defaults to `FOOD_DATABASE_FILE`.
+
+    Returns:
+        MenuIndex: index of menu
+
+    Example:
+    >>> get_menu_index() is get_menu_index()
+    True
+    """
+    filename = filename or FOOD_DATABASE_FILE
+    mtime = os.stat(filename).st_mtime_ns
+    cached = _menu_index_cache.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(filename, 'r', encoding="utf-8") as file:
+            cached = (mtime, MenuIndex(json.load(file)))
+        _menu_index_cache[filename] = cached
+    return cached[1]
+
 def dishes_to_products(dishes: list[str]) -> list[str]:
     """ Return all productes presented in given `dishes`
     based on information in `FOOD_DATABASE_FILE`.
@@ -119,12 +570,10 @@ def dishes_to_products(dishes: list[str]) -> list[str]:
     >>> dishes_to_products(['Крем суп з броколі','Макарони з сиром','Компот'])
     ['Броколі', 'Тісто', 'Сир', 'Ягоди']
     """
-    with open(FOOD_DATABASE_FILE, 'r', encoding="utf-8") as file:
-        menu = json.load(file)
-    menu = structure_menu(menu)
+    menu = get_menu_index()
     product_query = []
     for dish in dishes:
-        product_query.extend(menu[dish][-1])
+        product_query.extend(menu.dish_products[dish])
     return product_query
 
 
@@ -146,15 +595,12 @@ def calculate_dishes_power(products_power: dict[str, int]
     >>> list(query.items())[:3]
     [('Крем суп з броколі', 1), ('Борщ з мʼясом', 13), ('Суп грибний', 10)]
     """
-    with open(FOOD_DATABASE_FILE, 'r', encoding="utf-8") as file:
-        menu = json.load(file)
-    menu = structure_menu(menu)
-    query = {}
-    for dish, dish_info in menu.items():
-        power = 0
-        for product, product_p in products_power.items():
-            power += product_p if product in dish_info[-1] else 0
-        query[dish] = power
+    menu = get_menu_index()
+    query = dict.fromkeys(menu.dish_type, 0)
+    # Visit only dishes which contain product, instead of all dishes
+    for product, product_p in products_power.items():
+        for dish in menu.product_dishes.get(product, ()):
+            query[dish] += product_p
     return query
 
 
@@ -175,20 +621,23 @@ def divide_dishes_by_type(dishes: list[str]) -> tuple[list[str], list[str], list
         'Піца', 'Кава'])
     (['Борщ з мʼясом', 'Суп грибний', 'Крем суп з броколі'], ['Піца'], ['Кава'])
     """
-    with open(FOOD_DATABASE_FILE, 'r', encoding="utf-8") as file:
-        menu = json.load(file)
-    menu = list(menu.items())
-    query = [[dish for dish in dishes if dish in section[1]] for section in menu]
-    return tuple(query)
+    menu = get_menu_index()
+    query = {dish_type: [] for dish_type in menu.type_dishes}
+    for dish in dishes:
+        if dish in menu.dish_type:
+            query[menu.dish_type[dish]].append(dish)
+    return tuple(query.values())
 
 
 # Oleksii
-def calculate_products_power(graph: dict[str, list[str]]) -> dict[str, int]:
+def calculate_products_power(graph: Graph | CompactGraph | SessionStream) -> dict[str, int]:
     """ Calculate power of all product based on their
         connections in `graph`.
 
     Args:
-        graph (Graph): graph with sessions and products connections
+        graph (Graph | CompactGraph | SessionStream): graph with sessions and
+            products connections, or stream of sessions (then sessions are
+            counted one by one and never kept in memory)
 
     Returns:
         dict[str, int]: dictionary where key is name of product
@@ -209,11 +658,24 @@ def calculate_products_power(graph: dict[str, list[str]]) -> dict[str, int]:
     ... }
     >>> calculate_products_power(graph)
     {'product_a': 4, 'product_b': 3, 'product_c': 3, 'product_d': 1}
+    >>> calculate_products_power(CompactGraph.from_graph(graph))
+    {'product_a': 4, 'product_b': 3, 'product_c': 3, 'product_d': 1}
+    >>> calculate_products_power(iter(graph.items()))
+    {'product_a': 4, 'product_b': 3, 'product_c': 3, 'product_d': 1}
 
     """
+    if isinstance(graph, CompactGraph):
+        # Count ids, names are needed only once per product
+        counts = [0] * len(graph.products)
+        for product in graph.indices:
+            counts[product] += 1
+        return {graph.products.name(product): count
+                for product, count in enumerate(counts) if count}
+
     product_power = {}
 
-    for products in graph.values():
+    sessions = graph.values() if isinstance(graph, dict) else (products for _, products in graph)
+    for products in sessions:
         for product in products:
             if product in product_power:
                 product_power[product] += 1
@@ -222,6 +684,95 @@ def calculate_products_power(graph: dict[str, list[str]]) -> dict[str, int]:
     return product_power
 
 
+def update_products_power(products_power: dict[str, int],
+                          products: list[str]) -> dict[str, int]:
+    """ Add power of `products` from one new session to `products_power`.
+    Gives the same result as `calculate_products_power` on graph with
+    this session, but costs only O(len(products)).
+
+    Args:
+        products_power (dict[str, int]): products power to modify
+        products (list[str]): products from new session
+
+    Returns:
+        dict[str, int]: modified products power
+
+    Example:
+    >>> update_products_power({'product_a': 4, 'product_b': 3}, ['product_b', 'product_e'])
+    {'product_a': 4, 'product_b': 4, 'product_e': 1}
+    """
+    for product in products:
+        products_power[product] = products_power.get(product, 0) + 1
+    return products_power
+
+def save_products_power(products_power: dict[str, int], sessions: int, filename: str):
+    """ Save aggregated products power (sidecar of session log) to file (json)
+
+    File is replaced atomically, so reader never sees half-written counts.
+
+    Args:
+        products_power (dict[str, int]): products power to save
+        sessions (int): number of sessions counted in `products_power`
+        filename (str): name of destination file (json)
+    """
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({"sessions": sessions, "products": products_power},
+                  f, ensure_ascii=False)
+    os.replace(tmp_file, filename)
+
+def load_products_power(filename: str) -> tuple[dict[str, int], int]:
+    """ Read aggregated products power from file `filename` (json)
+
+    Args:
+        filename (str): name of file with products power (json)
+
+    Returns:
+        tuple[dict[str, int], int]: products power and number
+            of sessions counted in it
+
+    Examples:
+    >>> import tempfile
+    >>> counts_file = os.path.join(tempfile.mkdtemp(), "products_power.json")
+    >>> save_products_power({'product_a': 4, 'product_b': 3}, 3, counts_file)
+    >>> load_products_power(counts_file)
+    ({'product_a': 4, 'product_b': 3}, 3)
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data["products"], data["sessions"]
+
+def check_products_power(graph: Graph | SessionStream, products_power: dict[str, int],
+                         sessions: int) -> bool:
+    """ Check if aggregated `products_power` matches sessions in `graph`.
+    Rescans whole graph, so use it for verification, not on every request.
+
+    Args:
+        graph (Graph | SessionStream): graph with sessions and products
+            connections, or stream of sessions
+        products_power (dict[str, int]): aggregated products power
+        sessions (int): number of sessions counted in `products_power`
+
+    Returns:
+        bool: True if aggregate is consistent with `graph`
+
+    Example:
+    >>> graph = {"session_1": ["product_a", "product_b"], "session_2": ["product_a"]}
+    >>> check_products_power(graph, {'product_a': 2, 'product_b': 1}, 2)
+    True
+    >>> check_products_power(graph, {'product_a': 1, 'product_b': 1}, 1)
+    False
+    >>> check_products_power(iter(graph.items()), {'product_a': 2, 'product_b': 1}, 2)
+    True
+    """
+    counted_sessions = 0
+    counted_power = {}
+    for _, products in graph.items() if isinstance(graph, dict) else graph:
+        counted_sessions += 1
+        update_products_power(counted_power, products)
+    return sessions == counted_sessions and products_power == counted_power
+
+
 def sort_dishes(dishes_power: dict[str, int]) -> list[str]:
     """ Sort dishes based on their power.
     Dishes with more power appear first.
@@ -245,6 +796,69 @@ def sort_dishes(dishes_power: dict[str, int]) -> list[str]:
     return [dish[0] for dish in dish_and_power]
 
 
+class LazyRankedDishes(Sequence):
+    """ Dishes of one type ordered by power, like part of `sort_dishes` result.
+    Only first `k` dishes are selected at creation (with heap),
+    full ordering is computed only when dish after first `k` is accessed.
+
+    Example:
+    >>> dishes = LazyRankedDishes(['a', 'b', 'c', 'd'], {'a': 1, 'b': 3, 'c': 3, 'd': 2}, 2)
+    >>> dishes[0], dishes[1], len(dishes)
+    ('b', 'c', 4)
+    >>> list(dishes)
+    ['b', 'c', 'd', 'a']
+    """
+    def __init__(self, dishes: list[str], dishes_power: dict[str, int], k: int):
+        self._dishes = dishes
+        self._dishes_power = dishes_power
+        # Same as sorted(...)[:k], ties keep order of `dishes`
+        self._ranked = heapq.nlargest(k, dishes, key=dishes_power.get)
+        self._fully_sorted = len(self._ranked) == len(dishes)
+
+    def _sort(self):
+        self._ranked = sorted(self._dishes, key=self._dishes_power.get, reverse=True)
+        self._fully_sorted = True
+
+    def __len__(self) -> int:
+        return len(self._dishes)
+
+    def __getitem__(self, index):
+        if not self._fully_sorted:
+            if isinstance(index, slice):
+                if index.stop is None or index.stop < 0 or index.stop > len(self._ranked) \
+                        or (index.start or 0) < 0:
+                    self._sort()
+            elif index < 0 or index >= len(self._ranked):
+                self._sort()
+        return self._ranked[index]
+
+def top_dishes_by_type(dishes_power: dict[str, int], k: int) -> tuple[LazyRankedDishes, ...]:
+    """ Divide dishes by type and order them by power, like
+    `divide_dishes_by_type(sort_dishes(dishes_power))`, but
+    without sorting whole menu: only top `k` dishes of every
+    type are selected, rest is sorted lazily when needed.
+
+    Args:
+        dishes_power (dict[str, int]): dictionary where key is dish name
+            and value is dish power
+        k (int): number of best dishes of every type to select right away
+
+    Returns:
+        tuple[LazyRankedDishes, ...]: sorted dishes of every type
+
+    Example:
+    >>> dishes_power = calculate_dishes_power({"Броколі":1, "Картопля":10, "Буряк":3})
+    >>> [list(dishes) for dishes in top_dishes_by_type(dishes_power, 5)] == \
+[list(dishes) for dishes in divide_dishes_by_type(sort_dishes(dishes_power))]
+    True
+    """
+    menu = get_menu_index()
+    typed_dishes = {dish_type: [] for dish_type in menu.type_dishes}
+    for dish in dishes_power:
+        if dish in menu.dish_type:
+            typed_dishes[menu.dish_type[dish]].append(dish)
+    return tuple(LazyRankedDishes(dishes, dishes_power, k) for dishes in typed_dishes.values())
+
 if __name__ == "__main__":
     import doctest
     print(doctest.testmod())
@@ -0,0 +1,446 @@
+""" Module with binary snapshot of graph, which is opened
+with `mmap` without parsing, so loading takes almost constant time
+
+Snapshot of session log covers its first `source_size` bytes. When log is
+loaded, only records appended after that are parsed (`load_log_with_snapshot`).
+
+Snapshot layout (little-endian, every block aligned to 8 bytes):
+    header: magic, version, number of sessions, number of product ids
+        in all sessions, number of products, sizes of both string blobs,
+        size of covered part of session log and hash of its end
+    session offsets: uint64 * (sessions + 1)   - CSR offsets
+    session products: uint32 * product ids    - CSR indices
+    product names: uint64 offsets * (products + 1), utf-8 blob
+    session names: uint64 offsets * (sessions + 1), utf-8 blob
+    session order: uint32 * sessions          - session ids sorted by name
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from graph_logic import Graph
+from interning import Interner, CompactGraph
+
+SNAPSHOT_MAGIC = b"TRPZGRPH"
+SNAPSHOT_VERSION = 3
+# magic, version, reserved, sessions, indices, products,
+# size of product names blob, size of session names blob,
+# size of covered part of session log, hash of its last `_TAIL_SIZE` bytes
+_HEADER = struct.Struct("<8sIIQQQQQQ32s")
+# Bytes of session log before end of snapshot, whose hash shows
+# that log wasnt rewritten (cleared) after snapshot was saved
+_TAIL_SIZE = 4096
+# Snapshot is saved again when more sessions were appended to log after it
+SNAPSHOT_REFRESH_SESSIONS = 1000
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 8)
+
+def _string_table(names: list[str]) -> tuple[array, bytes]:
+    """ Encode `names` into offsets and one utf-8 blob """
+    offsets = array('Q', [0])
+    encoded = []
+    for name in names:
+        encoded.append(name.encode("utf-8"))
+        offsets.append(offsets[-1] + len(encoded[-1]))
+    return offsets, b"".join(encoded)
+
+
+class StringTable:
+    """ Names stored in snapshot. Name is decoded only when requested.
+    With `order` (ids sorted by name) name is found by binary search,
+    so names added after snapshot was loaded are checked and interned
+    without decoding all of them.
+    """
+    def __init__(self, offsets: np.ndarray, blob: memoryview, order: np.ndarray | None = None):
+        self._offsets = offsets
+        self._blob = blob
+        self._order = order
+        self._appended = Interner()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1 + len(self._appended)
+
+    def __contains__(self, name: str) -> bool:
+        return self.find(name) is not None
+
+    @property
+    def names(self) -> list[str]:
+        """ Decode all names """
+        blob = bytes(self._blob)
+        offsets = self._offsets.tolist()
+        return [str(blob[start:end], "utf-8")
+                for start, end in zip(offsets, offsets[1:])] + self._appended.names
+
+    def _encoded(self, name_id: int) -> bytes:
+        return bytes(self._blob[self._offsets[name_id]:self._offsets[name_id + 1]])
+
+    def name(self, name_id: int) -> str:
+        """ Return name with id `name_id` """
+        stored = len(self._offsets) - 1
+        if name_id >= stored:
+            return self._appended.name(name_id - stored)
+        return str(self._encoded(name_id), "utf-8")
+
+    def find(self, name: str) -> int | None:
+        """ Return id of `name` or None, in O(log(len)) """
+        name_id = self._appended.ids.get(name)
+        if name_id is not None:
+            return len(self._offsets) - 1 + name_id
+        if self._order is None:
+            raise ValueError("Names of snapshot cannot be searched without their order")
+        encoded = name.encode("utf-8")
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._encoded(self._order[middle]) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._order) and self._encoded(self._order[low]) == encoded:
+            return int(self._order[low])
+        return None
+
+    def intern(self, name: str) -> int:
+        """ Return id of `name`, giving it new id if it is not in table """
+        name_id = self.find(name)
+        if name_id is None:
+            name_id = len(self._offsets) - 1 + self._appended.intern(name)
+        return name_id
+
+
+class SnapshotGraph(CompactGraph):
+    """ `CompactGraph` whose arrays are views of memory-mapped snapshot file.
+    It is read without copying; arrays are copied into memory
+    only when new session is added. Names of sessions stay in snapshot,
+    names of added sessions are kept beside them (see `StringTable`).
+
+    Attributes:
+        source_size (int): size of covered part of session log (bytes)
+        source_hash (bytes): hash of end of covered part of session log
+    """
+    def __init__(self, mapped: mmap.mmap, products: Interner, sessions: StringTable,
+                 offsets: np.ndarray, indices: np.ndarray, source_size: int = 0,
+                 source_hash: bytes = b""):
+        super().__init__(products, sessions, offsets, indices)
+        self._mapped = mapped
+        self.source_size = source_size
+        self.source_hash = source_hash
+
+    def add_session(self, products, session=None):
+        if isinstance(self.offsets, np.ndarray):
+            self.offsets = array('Q', self.offsets.tobytes())
+            self.indices = array('I', self.indices.tobytes())
+        super().add_session(products, session)
+
+
+def save_graph_snapshot(graph: Graph | CompactGraph, filename: str,
+                        source_size: int = 0, source_hash: bytes = b""):
+    """ Save graph to binary snapshot file. File is written to temporary
+    file first and then replaced, so reader never sees half-written snapshot.
+
+    Args:
+        graph (Graph | CompactGraph): graph to save
+        filename (str): name of destination file
+        source_size (int, optional): size of session log covered by graph
+            (bytes). Defaults to 0.
+        source_hash (bytes, optional): hash of end of covered part of
+            session log, see `_log_tail_hash`. Defaults to b"".
+    """
+    if not isinstance(graph, CompactGraph):
+        graph = CompactGraph.from_graph(graph)
+    product_offsets, product_blob = _string_table(
+        [graph.products.name(i) for i in range(len(graph.products))])
+    session_names = graph.sessions.names
+    session_offsets, session_blob = _string_table(session_names)
+    encoded_names = [name.encode("utf-8") for name in session_names]
+    session_order = array('I', sorted(range(len(encoded_names)), key=encoded_names.__getitem__))
+    offsets = array('Q', graph.offsets)
+    indices = array('I', graph.indices)
+
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(graph),
+                             len(indices), len(graph.products),
+                             len(product_blob), len(session_blob), source_size, source_hash))
+        for block in (offsets.tobytes(), indices.tobytes(), product_offsets.tobytes(),
+                      product_blob, session_offsets.tobytes(), session_blob,
+                      session_order.tobytes()):
+            f.write(block)
+            f.write(_padding(len(block)))
+    os.replace(tmp_file, filename)
+
+def _check_offsets(offsets: np.ndarray, size: int, filename: str):
+    """ Check that `offsets` go from 0 to `size` without decreasing """
+    if offsets[0] != 0 or offsets[-1] != size or np.any(offsets[1:] < offsets[:-1]):
+        raise ValueError(f"Snapshot file {filename} is corrupted")
+
+def load_graph_snapshot(filename: str) -> SnapshotGraph:
+    """ Open binary snapshot file with `mmap`. Sessions are not parsed
+    or copied, only names of products are decoded. Offsets and product
+    ids are checked to be in range, so corrupted file is not read out of bounds.
+
+    Args:
+        filename (str): name of snapshot file
+
+    Returns:
+        SnapshotGraph: graph backed by snapshot file
+
+    Raises:
+        ValueError: if file is not snapshot of current version or is corrupted
+
+    Examples:
+    >>> import tempfile
+    >>> snapshot_file = os.path.join(tempfile.mkdtemp(), "graph.bin")
+    >>> graph = {"session_1": ["Сир", "Тісто", "Сир"], "session_2": ["Ягоди"]}
+    >>> save_graph_snapshot(graph, snapshot_file)
+    >>> snapshot = load_graph_snapshot(snapshot_file)
+    >>> len(snapshot), snapshot.indices.tolist()
+    (2, [0, 1, 0, 2])
+    >>> snapshot.to_graph() == graph
+    True
+    >>> snapshot.add_session(["Ягоди"])
+    >>> snapshot.to_graph()["session_3"]
+    ['Ягоди']
+    >>> snapshot.sessions.find("session_2"), snapshot.sessions.find("session_3")
+    (1, 2)
+    >>> snapshot.add_session(["Сир"], "session_1")
+    Traceback (most recent call last):
+        ...
+    ValueError: Session 'session_1' is already in graph
+    >>> with open(snapshot_file, "r+b") as f:
+    ...     _ = f.seek(_HEADER.size + 8 * 3 + 4)
+    ...     _ = f.write((9).to_bytes(4, "little"))
+    >>> load_graph_snapshot(snapshot_file) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+        ...
+    ValueError: Snapshot file ... is corrupted
+    """
+    with open(filename, "rb") as f:
+        if f.seek(0, 2) < _HEADER.size:
+            raise ValueError(f"Snapshot file {filename} is too short")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, _, sessions, indices, products, product_blob, session_blob, \
+        source_size, source_hash = _HEADER.unpack_from(mapped, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"File {filename} is not graph snapshot of version {SNAPSHOT_VERSION}")
+
+    position = _HEADER.size
+
+    def take(dtype, count: int) -> np.ndarray:
+        nonlocal position
+        try:
+            block = np.frombuffer(mapped, dtype=dtype, count=count, offset=position)
+        except ValueError as error:
+            raise ValueError(f"Snapshot file {filename} is corrupted") from error
+        position += block.nbytes + len(_padding(block.nbytes))
+        return block
+
+    offsets = take(np.uint64, sessions + 1)
+    session_indices = take(np.uint32, indices)
+    product_offsets = take(np.uint64, products + 1)
+    product_names = StringTable(product_offsets, take(np.uint8, product_blob).data)
+    session_offsets = take(np.uint64, sessions + 1)
+    session_blob_data = take(np.uint8, session_blob).data
+    session_order = take(np.uint32, sessions)
+    session_names = StringTable(session_offsets, session_blob_data, session_order)
+
+    _check_offsets(offsets, indices, filename)
+    _check_offsets(product_offsets, product_blob, filename)
+    _check_offsets(session_offsets, session_blob, filename)
+    if indices and session_indices.max() >= products \
+            or sessions and session_order.max() >= sessions:
+        raise ValueError(f"Snapshot file {filename} is corrupted")
+
+    product_ids = Interner(product_names.names)
+    if len(product_ids) != products:
+        raise ValueError(f"Snapshot file {filename} has products with the same name")
+    return SnapshotGraph(mapped, product_ids, session_names, offsets, session_indices,
+                         source_size, source_hash)
+
+def _log_tail_hash(file, size: int) -> bytes:
+    """ Return hash of last `_TAIL_SIZE` bytes of first `size` bytes of `file` """
+    file.seek(max(size - _TAIL_SIZE, 0))
+    return hashlib.sha256(file.read(min(size, _TAIL_SIZE))).digest()
+
+def _read_log_records(file, graph: Graph) -> tuple[int, int]:
+    """ Add sessions from session log `file` (opened in binary mode),
+    starting from its current position, to `graph`. Last record without
+    newline is being written now, it is left for next read.
+
+    Returns:
+        tuple[int, int]: position after last read record and number of read records
+    """
+    position = file.tell()
+    records = 0
+    for line in file:
+        if not line.endswith(b"\n"):
+            break
+        position += len(line)
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # Record was cut by crash in the middle of write, skip it
+            continue
+        graph[record["session"]] = record["products"]
+        records += 1
+    return position, records
+
+def _is_stale(file, snapshot: SnapshotGraph | None) -> bool:
+    """ Check if `snapshot` is missing or doesnt match beginning of session
+    log `file` (log was cleared or rewritten after it was saved)
+    """
+    return snapshot is None or file.seek(0, 2) < snapshot.source_size \
+        or _log_tail_hash(file, snapshot.source_size) != snapshot.source_hash
+
+def save_log_snapshot(log_file: str, snapshot_file: str) -> Graph:
+    """ Read whole session log `log_file` and save it as snapshot `snapshot_file`
+
+    Returns:
+        Graph: graph with all sessions from log
+    """
+    graph = {}
+    try:
+        f = open(log_file, "rb")
+    except FileNotFoundError:
+        return graph
+    with f:
+        source_size, _ = _read_log_records(f, graph)
+        source_hash = _log_tail_hash(f, source_size)
+    save_graph_snapshot(graph, snapshot_file, source_size, source_hash)
+    return graph
+
+def load_log_with_snapshot(log_file: str, snapshot_file: str,
+                           refresh: int = SNAPSHOT_REFRESH_SESSIONS) -> Graph:
+    """ Read session log `log_file` (json lines), taking sessions saved in
+    snapshot `snapshot_file` from it, so only records appended after snapshot
+    are parsed. Gives the same graph as `graph_logic.load_session_log`.
+
+    Snapshot is saved again if it is missing, doesnt match beginning of log
+    (log was cleared or rewritten) or more than `refresh` sessions
+    were appended to log after it.
+
+    Args:
+        log_file (str): name of session log file (jsonl)
+        snapshot_file (str): name of snapshot file
+        refresh (int, optional): number of appended sessions after which
+            snapshot is saved again. Defaults to `SNAPSHOT_REFRESH_SESSIONS`.
+
+    Returns:
+        Graph: graph with all sessions from log
+
+    Example:
+    >>> import tempfile
+    >>> import graph_logic
+    >>> folder = tempfile.mkdtemp()
+    >>> log_file, snapshot_file = os.path.join(folder, "graph.jsonl"), \
+os.path.join(folder, "graph.bin")
+    >>> graph_logic.append_session_record("session_1", ["Сир"], log_file)
+    >>> load_log_with_snapshot(log_file, snapshot_file)
+    {'session_1': ['Сир']}
+    >>> graph_logic.append_session_record("session_2", ["Ягоди"], log_file)
+    >>> load_log_with_snapshot(log_file, snapshot_file)
+    {'session_1': ['Сир'], 'session_2': ['Ягоди']}
+    >>> len(load_graph_snapshot(snapshot_file))
+    1
+    >>> with open(log_file, "w", encoding="utf-8"):
+    ...     pass
+    >>> graph_logic.append_session_record("session_1", ["Тісто"], log_file)
+    >>> graph_logic.append_session_record("session_2", ["Тісто", "Ягоди"], log_file)
+    >>> load_log_with_snapshot(log_file, snapshot_file) == \
+graph_logic.load_session_log(log_file)
+    True
+    """
+    try:
+        snapshot = load_graph_snapshot(snapshot_file)
+    except (FileNotFoundError, ValueError):
+        snapshot = None
+    try:
+        f = open(log_file, "rb")
+    except FileNotFoundError:
+        return {}
+    with f:
+        stale = _is_stale(f, snapshot)
+        graph = {} if stale else snapshot.to_graph()
+        f.seek(0 if stale else snapshot.source_size)
+        # Arrays of snapshot refer to mapped file, it is closed before file is replaced
+        del snapshot
+        source_size, records = _read_log_records(f, graph)
+        if stale or records > refresh:
+            save_graph_snapshot(graph, snapshot_file, source_size,
+                                _log_tail_hash(f, source_size))
+    return graph
+
+def load_compact_log_with_snapshot(log_file: str, snapshot_file: str,
+                                   refresh: int = SNAPSHOT_REFRESH_SESSIONS) -> CompactGraph:
+    """ Like `load_log_with_snapshot`, but sessions of snapshot are not
+    translated into names: returned graph reads CSR arrays of snapshot
+    directly and only records appended after snapshot are parsed and added
+    to it. Snapshot is saved again (from whole log) if it is missing or
+    stale, more than `refresh` sessions were appended after it, or appended
+    session has name of session that is already in it.
+
+    Args:
+        log_file (str): name of session log file (jsonl)
+        snapshot_file (str): name of snapshot file
+        refresh (int, optional): number of appended sessions after which
+            snapshot is saved again. Defaults to `SNAPSHOT_REFRESH_SESSIONS`.
+
+    Returns:
+        CompactGraph: graph with all sessions from log
+
+    Example:
+    >>> import tempfile
+    >>> import graph_logic
+    >>> folder = tempfile.mkdtemp()
+    >>> log_file, snapshot_file = os.path.join(folder, "graph.jsonl"), \
+os.path.join(folder, "graph.bin")
+    >>> graph_logic.append_session_record("session_1", ["Сир"], log_file)
+    >>> len(load_compact_log_with_snapshot(log_file, snapshot_file))
+    1
+    >>> graph_logic.append_session_record("session_2", ["Ягоди"], log_file)
+    >>> graph = load_compact_log_with_snapshot(log_file, snapshot_file)
+    >>> graph.offsets.tolist(), graph.indices.tolist(), len(load_graph_snapshot(snapshot_file))
+    ([0, 1, 2], [0, 1], 1)
+    >>> graph_logic.append_session_record("session_1", ["Тісто"], log_file)
+    >>> load_compact_log_with_snapshot(log_file, snapshot_file).to_graph() == \
+graph_logic.load_session_log(log_file)
+    True
+    >>> len(load_graph_snapshot(snapshot_file))
+    2
+    """
+    try:
+        snapshot = load_graph_snapshot(snapshot_file)
+    except (FileNotFoundError, ValueError):
+        snapshot = None
+    try:
+        f = open(log_file, "rb")
+    except FileNotFoundError:
+        return CompactGraph()
+    with f:
+        if not _is_stale(f, snapshot):
+            f.seek(snapshot.source_size)
+            appended = {}
+            _, records = _read_log_records(f, appended)
+            if records <= refresh and not any(session in snapshot.sessions
+                                              for session in appended):
+                for session, products in appended.items():
+                    snapshot.add_session(products, session)
+                return snapshot
+    # Arrays of snapshot refer to mapped file, it is closed before file is replaced
+    del snapshot
+    save_log_snapshot(log_file, snapshot_file)
+    return load_graph_snapshot(snapshot_file)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
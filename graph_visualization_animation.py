@@ -1,4 +1,6 @@
 from manim import *
+from animation_layout import AnimationLayout, LAYOUT_FILE, fit_to_frame
+from graph_visualization_png import weighted_edges
 
 def organise_graph(graph_data):
     """
@@ -34,15 +36,22 @@ def organise_graph(graph_data):
     return edge_list
 
 
-def create_scene(graph_data):
+def create_scene(graph_data, since_last_render=False, max_nodes=None, layout_file=LAYOUT_FILE):
     """
     Creates and renders a scene with a graph visualization.
 
     The function sets up a simple graph with nodes (sessions and products) and edges
     that represent relationships between them. It uses Manim's Graph class to visualize
     the graph and plays the animation.
+    Node positions are kept in `layout_file` between runs, so only new nodes
+    are placed (see animation_layout.AnimationLayout).
     Args:
         graph_data(dict): a dict with sessions
+        since_last_render(bool): draw sessions that were already rendered
+            without animation and animate only new ones
+        max_nodes(int | None): draw only this many most bought products and
+            as many sessions, see `graph_visualization_png.weighted_edges`
+        layout_file(str): file with node positions from previous runs
     Returns:
         Scene: The scene object with the graph animation.
     Example:
@@ -53,14 +62,35 @@ def create_scene(graph_data):
     """
     scene = Scene()  # Create a new scene object
 
-    edge_list = organise_graph(graph_data)
+    # Duplicate edges are collapsed and only `max_nodes` nodes are kept
+    edge_list = [(session, product) for session, product, _
+                 in weighted_edges(graph_data, top_nodes=max_nodes)]
 
-    # Find unique nodes (both sessions and products) from the edge list
-    vertices = {node for edge in edge_list for node in edge}
+    # Place only nodes that are not in cached layout yet
+    layout = AnimationLayout.load(layout_file)
+    new_sessions = set(graph_data) - layout.sessions if since_last_render else set(graph_data)
+    positions = fit_to_frame(layout.place(edge_list))
+    layout.sessions.update(graph_data)
+    layout.save(layout_file)
 
-    # Create the graph using the edge list and the list of vertices
-    graph = Graph(vertices, edge_list, layout="spring", vertex_config={"color": BLUE}, edge_config={"color": WHITE})
-    scene.play(Create(graph)) # Play the scene
+    old_edges = [edge for edge in edge_list if edge[0] not in new_sessions]
+    new_edges = [edge for edge in edge_list if edge[0] in new_sessions]
+
+    # Already rendered part of graph is shown at once, with the cached positions of vertices
+    vertices = list(dict.fromkeys(node for edge in old_edges for node in edge))
+    graph = Graph(vertices, old_edges, layout={node: positions[node] for node in vertices},
+                  vertex_config={"color": BLUE}, edge_config={"color": WHITE})
+    scene.add(graph)
+    if new_edges:
+        # New sessions and products are added to the same graph, so products
+        # shared with old sessions are drawn once
+        new_vertices = [node for node in dict.fromkeys(node for edge in new_edges for node in edge)
+                        if node not in graph.vertices]
+        if new_vertices:
+            scene.play(graph.animate.add_vertices(
+                *new_vertices, positions={node: positions[node] for node in new_vertices},
+                vertex_config={"color": BLUE}))
+        scene.play(graph.animate.add_edges(*new_edges, edge_config={"color": WHITE}))
     scene.wait(2)  # Wait 2 seconds after the animation
 
     return scene
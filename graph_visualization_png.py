@@ -2,16 +2,26 @@
 
 import doctest
 import doctest
-from graph_logic import Graph
+import heapq
+import os
+from typing import Callable, Iterable, Iterator, TextIO
+from graph_logic import Graph, SessionStream
+from interning import CompactGraph
+from cooccurrence import CooccurrenceIndex
+import graphviz
 from graphviz import Digraph
 
+# Graph, compact graph or function that returns new stream of sessions every time
+SessionSource = Graph | CompactGraph | Callable[[], SessionStream]
 
-def organise_graph(graph: Graph):
+
+def organise_graph(graph: Graph | CompactGraph):
     '''
     Converts Graph type (dict[str, list[str]]) to list(tuple)
+    Ids of CompactGraph are translated back to names here
 
     Args:
-        graph (dict[str, list[str]]): graph to vizualize
+        graph (dict[str, list[str]] | CompactGraph): graph to vizualize
     Returns:
         edge_list (list(tuple)): a list of graph edges
     Examples:
@@ -19,6 +29,9 @@ def organise_graph(graph: Graph):
     "session_2" : ["product_7", "product_9"]})
     [('session_1', 'product_1'), ('session_1', 'product_2'), ('session_1', 'product_3'), ('session_1', 'product_1'), ('session_2', 'product_7'), ('session_2', 'product_9')]
     '''
+    if isinstance(graph, CompactGraph):
+        return [(graph.sessions.name(session), graph.products.name(product))
+                for session, products in graph.items() for product in products]
     edge_list = []
     for key, values in graph.items():
         for value in values:
@@ -43,6 +56,189 @@ def generate_graph_png(edge_list, output_file="graph.png"):
 
     dot.render(output_file, cleanup=True)
 
+def _session_stream(graph: "SessionSource") -> SessionStream:
+    """ Return new stream of sessions (session, product names) of `graph` """
+    if isinstance(graph, CompactGraph):
+        names = graph.products.names
+        return ((graph.sessions.name(session), [names[product] for product in products])
+                for session, products in graph.items())
+    if isinstance(graph, dict):
+        return iter(graph.items())
+    return graph()
+
+
+def _top_products(graph: "SessionSource", top_nodes: int, distinct: bool) -> set[str]:
+    """ First pass over sessions: `top_nodes` products bought most often
+    (counting every product once per session if `distinct`)
+    """
+    power = {}
+    for _, products in _session_stream(graph):
+        for product in (dict.fromkeys(products) if distinct else products):
+            power[product] = power.get(product, 0) + 1
+    return set(heapq.nlargest(top_nodes, power, key=power.get))
+
+
+def weighted_edges(graph: "SessionSource", mode: str = "session",
+                   top_nodes: int | None = None) -> Iterator[tuple[str, str, int]]:
+    """
+    Collapses duplicate edges of graph into weighted ones. Sessions are read
+    one by one, so only kept edges are held in memory: without `top_nodes`
+    session edges are yielded while sessions are read, with it two passes
+    are made (choose products, then choose sessions or count their pairs).
+
+    Args:
+        graph (dict[str, list[str]] | CompactGraph | Callable[[], SessionStream]):
+            graph to vizualize, or function that returns new stream of its
+            sessions every time it is called (e.g. `SessionStore.iter_sessions`)
+        mode (str): "session" - edges session -> product, weight is number
+            of times product is in session; "product" - edges product -- product,
+            weight is number of sessions with both products
+        top_nodes (int | None): None - keep all nodes. Otherwise only
+            `top_nodes` most bought products are kept, and in "session" mode
+            also `top_nodes` sessions with most purchases of kept products
+            (sessions and products are ranked separately, because every
+            product has much more edges than any session)
+    Returns:
+        Iterator[tuple[str, str, int]]: edges with their weights
+    Examples:
+    >>> graph = {"session_1" : ["product_1", "product_2", "product_1"],\
+    "session_2" : ["product_1", "product_2"], "session_3": ["product_3"]}
+    >>> list(weighted_edges(graph))
+    [('session_1', 'product_1', 2), ('session_1', 'product_2', 1), ('session_2', 'product_1', 1), ('session_2', 'product_2', 1), ('session_3', 'product_3', 1)]
+    >>> list(weighted_edges(graph, "product"))
+    [('product_1', 'product_2', 2)]
+    >>> list(weighted_edges(graph, top_nodes=1))
+    [('session_1', 'product_1', 2)]
+    >>> list(weighted_edges(lambda: iter(graph.items()), top_nodes=2))
+    [('session_1', 'product_1', 2), ('session_1', 'product_2', 1), ('session_2', 'product_1', 1), ('session_2', 'product_2', 1)]
+    """
+    kept = None
+    if top_nodes is not None:
+        kept = _top_products(graph, top_nodes, distinct=mode == "product")
+
+    if mode == "product":
+        index = CooccurrenceIndex()
+        for _, products in _session_stream(graph):
+            index.add_session(products if kept is None
+                              else [product for product in products if product in kept])
+        for product, row in index.rows.items():
+            for other, count in row.items():
+                if product < other:
+                    yield product, other, count
+        return
+
+    if kept is None:
+        for session, products in _session_stream(graph):
+            counts = {}
+            for product in products:
+                counts[product] = counts.get(product, 0) + 1
+            for product, count in counts.items():
+                yield session, product, count
+        return
+
+    # Min-heap of (purchases of kept products, order, session, counts)
+    best = []
+    for order, (session, products) in enumerate(_session_stream(graph)):
+        counts = {}
+        for product in products:
+            if product in kept:
+                counts[product] = counts.get(product, 0) + 1
+        if not counts:
+            continue
+        entry = (sum(counts.values()), -order, session, counts)
+        if len(best) < top_nodes:
+            heapq.heappush(best, entry)
+        elif entry[:2] > best[0][:2]:
+            heapq.heapreplace(best, entry)
+    for _, _, session, counts in sorted(best, key=lambda entry: -entry[1]):
+        for product, count in counts.items():
+            yield session, product, count
+
+
+def prune_edges(edges: Iterable[tuple[str, str, int]], top_edges: int | None = None
+                ) -> Iterable[tuple[str, str, int]]:
+    """
+    Keeps only `top_edges` heaviest edges (in their order), memory is
+    proportional to `top_edges`, not to number of edges
+
+    Args:
+        edges (Iterable[tuple[str, str, int]]): edges with weights
+        top_edges (int | None): number of kept edges, None - all
+    Returns:
+        Iterable[tuple[str, str, int]]: kept edges with their weights
+    Examples:
+    >>> edges = [("a", "b", 5), ("a", "c", 1), ("b", "c", 2), ("c", "d", 1)]
+    >>> list(prune_edges(edges, top_edges=2))
+    [('a', 'b', 5), ('b', 'c', 2)]
+    """
+    if top_edges is None:
+        return edges
+    best = heapq.nlargest(top_edges, ((edge[2], -order, edge) for order, edge
+                                      in enumerate(edges)))
+    return [edge for _, _, edge in sorted(best, key=lambda entry: -entry[1])]
+
+
+def _quote(name: str) -> str:
+    """ Return name as DOT string """
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_dot(edges: Iterable[tuple[str, str, int]], file: TextIO, directed: bool = True):
+    """
+    Writes weighted edges into DOT file line by line,
+    thicker lines for heavier edges
+
+    Args:
+        edges (Iterable[tuple[str, str, int]]): edges with weights
+        file (TextIO): opened destination file
+        directed (bool): write digraph (->) or graph (--)
+    Examples:
+    >>> import io
+    >>> file = io.StringIO()
+    >>> write_dot([("session_1", "Яйце", 2), ("session_1", 'a "b"', 1)], file)
+    >>> print(file.getvalue(), end="")
+    digraph {
+        "session_1" -> "Яйце" [label=2 penwidth=2]
+        "session_1" -> "a \\"b\\"" [label=1 penwidth=1]
+    }
+    """
+    arrow = "->" if directed else "--"
+    file.write("digraph {\n" if directed else "graph {\n")
+    for start, end, weight in edges:
+        # Line width grows slowly, so heavy edges dont cover whole picture
+        penwidth = min(weight, 1 + weight.bit_length())
+        file.write(f"    {_quote(start)} {arrow} {_quote(end)} "
+                   f"[label={weight} penwidth={penwidth}]\n")
+    file.write("}\n")
+
+
+def generate_weighted_graph_png(graph: SessionSource, output_file: str = "graph",
+                                mode: str = "session", top_nodes: int | None = None,
+                                top_edges: int | None = None) -> str:
+    """
+    Creates a PNG-image of graph with weighted edges. DOT source is streamed
+    into temporary `output_file`.gv, rendered with Graphviz and removed
+
+    Args:
+        graph (dict[str, list[str]] | CompactGraph | Callable[[], SessionStream]):
+            graph to vizualize, see `weighted_edges`
+        output_file (str): path of image without extension
+        mode (str): kind of edges, see `weighted_edges`
+        top_nodes (int | None): number of kept nodes, see `weighted_edges`
+        top_edges (int | None): number of kept edges, None - all
+    Returns:
+        str: path of PNG file
+    """
+    edges = prune_edges(weighted_edges(graph, mode, top_nodes), top_edges)
+    dot_file = output_file + ".gv"
+    with open(dot_file, "w", encoding="utf-8") as file:
+        write_dot(edges, file, directed=mode == "session")
+    try:
+        return graphviz.render("dot", "png", dot_file, outfile=output_file + ".png")
+    finally:
+        os.remove(dot_file)
+
+
 def test_visualization():
     """
     Function with predefined graph to test visualization
@@ -0,0 +1,292 @@
+""" Module with timing spans of recommendation pipeline.
+Durations are collected in in-process histograms, which can be printed
+as report or saved as Prometheus text file.
+
+Instrumentation is off by default: then `span` returns shared empty
+context manager and `timed` calls function directly, so the cost is one
+check of global flag. It is enabled by `enable()` (`--metrics` option of
+main.py) or by environment variable TRAPEZNA_METRICS=1.
+"""
+
+import cProfile
+import contextlib
+import functools
+import os
+import time
+import tracemalloc
+from bisect import bisect_left
+
+# Upper bounds of histogram buckets (seconds): 10us, 20us, ... ~21s
+BUCKETS = tuple(0.00001 * 2 ** i for i in range(22))
+
+# Name of metric in Prometheus text file
+METRIC_NAME = "trapezna_span_seconds"
+
+ENABLED = os.environ.get("TRAPEZNA_METRICS", "") not in ("", "0")
+
+# Span name -> Histogram
+HISTOGRAMS = {}
+
+# Counter name -> value
+COUNTERS = {}
+
+# Span name, file prefix and number of calls to skip before
+# profiling one, see `capture_next`
+_CAPTURE = None
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Histogram:
+    """ Histogram of durations with fixed buckets (`BUCKETS`)
+
+    Attributes:
+        counts (list[int]): number of durations in every bucket,
+            last one is for durations bigger than all bounds
+        count (int): number of durations
+        total (float): sum of durations (seconds)
+        max (float): biggest duration (seconds)
+
+    Example:
+    >>> histogram = Histogram()
+    >>> for duration in [0.001, 0.001, 0.002, 0.5]:
+    ...     histogram.observe(duration)
+    >>> histogram.count, histogram.total, histogram.max
+    (4, 0.504, 0.5)
+    >>> histogram.quantile(0.5) == BUCKETS[7]
+    True
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration: float):
+        """ Add one duration (seconds) """
+        self.counts[bisect_left(BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def quantile(self, q: float) -> float:
+        """ Return upper bound of bucket with `q` quantile of durations
+        (exact `max` if quantile is in last bucket)
+        """
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+
+class _Span:
+    """ Context manager that adds its duration to histogram of `name` """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+def enable(enabled: bool = True):
+    """ Turn instrumentation on or off """
+    global ENABLED
+    ENABLED = enabled
+
+def reset():
+    """ Remove all collected durations and counters """
+    HISTOGRAMS.clear()
+    COUNTERS.clear()
+
+def observe(name: str, duration: float):
+    """ Add `duration` (seconds) to histogram of span `name` """
+    histogram = HISTOGRAMS.get(name)
+    if histogram is None:
+        histogram = HISTOGRAMS[name] = Histogram()
+    histogram.observe(duration)
+
+def add_to_counter(name: str, value: int = 1):
+    """ Add `value` to counter `name` (does nothing when instrumentation is off)
+
+    Example:
+    >>> enable(); reset()
+    >>> add_to_counter("frames"); add_to_counter("cells_written", 80)
+    >>> COUNTERS
+    {'frames': 1, 'cells_written': 80}
+    >>> enable(False)
+    """
+    if ENABLED:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+def span(name: str):
+    """ Return context manager that measures duration of its block
+    as span `name` (does nothing when instrumentation is off)
+
+    Example:
+    >>> enable(); reset()
+    >>> with span("sort"):
+    ...     _ = sorted(range(1000))
+    >>> HISTOGRAMS["sort"].count
+    1
+    >>> enable(False)
+    >>> with span("sort"):
+    ...     pass
+    >>> HISTOGRAMS["sort"].count
+    1
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+def timed(name: str):
+    """ Decorator that measures every call of function as span `name`.
+    If `capture_next` was called with `name`, next call is also profiled.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _CAPTURE is not None and (prefix := _take_capture(name)):
+                with capture(prefix):
+                    return _call_timed(name, function, args, kwargs)
+            if not ENABLED:
+                return function(*args, **kwargs)
+            return _call_timed(name, function, args, kwargs)
+        return wrapper
+    return decorator
+
+def _call_timed(name, function, args, kwargs):
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def capture_next(name: str, prefix: str = "request", skip: int = 0):
+    """ Profile one call of function decorated by `timed(name)`,
+    see `capture` for where results are saved
+
+    Args:
+        name (str): name of span
+        prefix (str, optional): beginning of names of result files.
+            Defaults to "request".
+        skip (int, optional): number of calls before profiled one. Defaults to 0.
+
+    Example:
+    >>> import tempfile
+    >>> prefix = os.path.join(tempfile.mkdtemp(), "request")
+    >>> @timed("double")
+    ... def double(x):
+    ...     return x * 2
+    >>> capture_next("double", prefix, skip=1)
+    >>> double(1), os.path.exists(prefix + ".prof")
+    (2, False)
+    >>> double(2), os.path.exists(prefix + ".prof"), os.path.exists(prefix + ".mem.txt")
+    (4, True, True)
+    """
+    global _CAPTURE
+    _CAPTURE = (name, prefix, skip)
+
+def _take_capture(name: str) -> str | None:
+    """ Count call of span `name`, return file prefix if this call is profiled """
+    global _CAPTURE
+    captured_name, prefix, skip = _CAPTURE
+    if captured_name != name:
+        return None
+    if skip:
+        _CAPTURE = (name, prefix, skip - 1)
+        return None
+    _CAPTURE = None
+    return prefix
+
+@contextlib.contextmanager
+def capture(prefix: str, memory_top: int = 25):
+    """ Profile block with cProfile and tracemalloc. Profile is saved
+    to `prefix`.prof (open with pstats or snakeviz), biggest allocations -
+    to `prefix`.mem.txt
+
+    Args:
+        prefix (str): beginning of names of result files
+        memory_top (int, optional): number of allocation sites saved. Defaults to 25.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(prefix + ".prof")
+        with open(prefix + ".mem.txt", "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {peak} bytes\n")
+            for statistic in snapshot.statistics("lineno")[:memory_top]:
+                f.write(f"{statistic}\n")
+
+def report() -> str:
+    """ Return table with statistics of every span (milliseconds)
+    and values of counters
+
+    Example:
+    >>> reset(); observe("build_ui", 0.002); observe("build_ui", 0.004)
+    >>> COUNTERS["frames"] = 2
+    >>> print(report())
+    span                          count   mean ms    p50 ms    p99 ms    max ms
+    build_ui                          2     3.000     2.560     5.120     4.000
+    frames                            2
+    """
+    lines = [f"{'span':<26}{'count':>9}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for name, histogram in sorted(HISTOGRAMS.items()):
+        lines.append(f"{name:<26}{histogram.count:>9}"
+                     f"{histogram.total / histogram.count * 1000:>10.3f}"
+                     f"{histogram.quantile(0.5) * 1000:>10.3f}"
+                     f"{histogram.quantile(0.99) * 1000:>10.3f}"
+                     f"{histogram.max * 1000:>10.3f}")
+    for name, value in sorted(COUNTERS.items()):
+        lines.append(f"{name:<26}{value:>9}")
+    return "\n".join(lines)
+
+def prometheus_text() -> str:
+    """ Return all histograms in Prometheus text exposition format
+
+    Example:
+    >>> reset(); observe("draw", 0.00001)
+    >>> print(prometheus_text().splitlines()[2])
+    trapezna_span_seconds_bucket{span="draw",le="1e-05"} 1
+    """
+    lines = [f"# HELP {METRIC_NAME} Duration of recommendation pipeline stages",
+             f"# TYPE {METRIC_NAME} histogram"]
+    for name, histogram in sorted(HISTOGRAMS.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+            lines.append(f'{METRIC_NAME}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{span="{name}"}} {histogram.total}')
+        lines.append(f'{METRIC_NAME}_count{{span="{name}"}} {histogram.count}')
+    for name, value in sorted(COUNTERS.items()):
+        lines.append(f"# TYPE trapezna_{name}_total counter")
+        lines.append(f"trapezna_{name}_total {value}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(filename: str):
+    """ Save all histograms to Prometheus text file (replacing it atomically) """
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_file, filename)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
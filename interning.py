@@ -0,0 +1,151 @@
+""" Module with interning of names (products, dishes, sessions)
+into dense integer ids and compact graph built on them
+"""
+
+from array import array
+from collections.abc import Iterable, Iterator
+
+
+class Interner:
+    """ Two-way mapping between names and dense integer ids (0, 1, 2, ...)
+
+    Example:
+    >>> products = Interner()
+    >>> products.intern("Сир"), products.intern("Тісто"), products.intern("Сир")
+    (0, 1, 0)
+    >>> products.name(1), len(products)
+    ('Тісто', 2)
+    >>> products.intern_all(["Тісто", "Ягоди"])
+    array('I', [1, 2])
+    """
+    def __init__(self, names: Iterable[str] = ()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        """ Return id of `name`, giving it new id if it is met first time """
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def intern_all(self, names: Iterable[str]) -> array:
+        """ Return compact array with ids of all `names` """
+        return array('I', (self.intern(name) for name in names))
+
+    def name(self, name_id: int) -> str:
+        """ Return name with id `name_id` """
+        return self.names[name_id]
+
+
+class CompactGraph:
+    """ Graph of sessions and products, where names are interned
+    into integer ids. Products of all sessions are stored in one flat
+    array `indices`, products of session `i` are
+    `indices[offsets[i]:offsets[i + 1]]` (CSR format).
+
+    Attributes:
+        products (Interner): ids of products
+        sessions (Interner): ids of sessions
+        offsets (array): start of products of every session in `indices`
+        indices (array): product ids of all sessions
+
+    Example:
+    >>> graph = CompactGraph.from_graph({"session_1": ["a", "b", "a"], "session_2": ["b"]})
+    >>> graph.indices, graph.offsets
+    (array('I', [0, 1, 0, 1]), array('Q', [0, 3, 4]))
+    >>> graph.add_session(["c", "a"])
+    >>> graph.to_graph()
+    {'session_1': ['a', 'b', 'a'], 'session_2': ['b'], 'session_3': ['c', 'a']}
+    >>> graph.add_session(["a"], "session_2")
+    Traceback (most recent call last):
+        ...
+    ValueError: Session 'session_2' is already in graph
+    >>> graph.add_session(array('I', [7]))
+    Traceback (most recent call last):
+        ...
+    ValueError: Product id 7 is out of range, graph has 3 products
+    >>> graph.session_products(3)
+    Traceback (most recent call last):
+        ...
+    IndexError: Session id 3 is out of range, graph has 3 sessions
+    """
+    def __init__(self, products: Interner | None = None, sessions: Interner | None = None,
+                 offsets: array | None = None, indices: array | None = None):
+        self.products = products or Interner()
+        self.sessions = sessions or Interner()
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+        self.indices = indices if indices is not None else array('I')
+
+    @classmethod
+    def from_graph(cls, graph: dict[str, list[str]]) -> "CompactGraph":
+        """ Build compact graph from usual graph (dict[str, list[str]]) """
+        compact = cls()
+        for session, products in graph.items():
+            compact.add_session(products, session)
+        return compact
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def add_session(self, products: Iterable[str] | array, session: str | None = None):
+        """ Add session with `products` (names or array of product ids)
+
+        Args:
+            products (Iterable[str] | array): products from new session
+            session (str | None, optional): name of session.
+                Defaults to `session_x`, where x is the number of session.
+
+        Raises:
+            ValueError: if session with this name is already in graph
+                (its id would stop matching its offsets), or if
+                product id is unknown
+        """
+        session = session or f"session_{len(self) + 1}"
+        if session in self.sessions:
+            raise ValueError(f"Session {session!r} is already in graph")
+        if isinstance(products, array):
+            if products and max(products) >= len(self.products):
+                raise ValueError(f"Product id {max(products)} is out of range, "
+                                 f"graph has {len(self.products)} products")
+            self.indices.extend(products)
+        else:
+            self.indices.extend(self.products.intern_all(products))
+        self.sessions.intern(session)
+        self.offsets.append(len(self.indices))
+
+    def session_products(self, session_id: int) -> array:
+        """ Return product ids of session with id `session_id` """
+        if not 0 <= session_id < len(self):
+            raise IndexError(f"Session id {session_id} is out of range, "
+                             f"graph has {len(self)} sessions")
+        return self.indices[self.offsets[session_id]:self.offsets[session_id + 1]]
+
+    def items(self) -> Iterator[tuple[int, array]]:
+        """ Iterate over pairs (session id, product ids of session) """
+        for session_id in range(len(self)):
+            yield session_id, self.session_products(session_id)
+
+    def to_graph(self) -> dict[str, list[str]]:
+        """ Translate back into usual graph (dict[str, list[str]]) with names """
+        # Ids are translated in one pass over flat array and then cut by offsets,
+        # it is several times faster than translating session by session
+        product_names = self.products.names
+        names = [product_names[product] for product in self.indices.tolist()]
+        offsets = self.offsets.tolist()
+        return {session: names[offsets[session_id]:offsets[session_id + 1]]
+                for session_id, session in enumerate(self.sessions.names)}
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
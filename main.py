@@ -1,10 +1,13 @@
 """ Main script that runs program """
 
 import argparse
-from ui import main_loop, clear_graph, GRAPH_FILE
-from graph_visualization_png import generate_graph_png, organise_graph
-from graph_visualization_animation import create_scene
-from graph_logic import load_graph
+import ui
+import instrumentation
+from ui import (main_loop, clear_graph, load_sessions, use_storage,
+                rebuild_products_power, check_products_power, RANKING_MODES,
+                STORAGE_BACKENDS, SESSION_LOG_FILE, SNAPSHOT_FILE,
+                VISUALIZATION_TOP_NODES, iter_sessions)
+from visualization_backends import get_backend, EDGE_MODES
 
 
 def main():
@@ -15,28 +18,140 @@ def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--visualization",
-                        help="run visualization animation for graph.json",
+                        help="run visualization animation for graph.jsonl",
                         action="store_true")
 
+    parser.add_argument("--since_last_render",
+                        help="animate only sessions added since last visualization",
+                        action="store_true")
+
+    parser.add_argument("--max_nodes",
+                        help="draw only this many most powerful nodes in visualization",
+                        type=int, default=None)
+
     parser.add_argument("--visualization_png",
                         help="save png of graph visualization",
                         action="store_true")
 
+    parser.add_argument("--edges",
+                        help="edges of png visualization: session -> product or "
+                             "product -- product bought together (default: session)",
+                        choices=EDGE_MODES, default="session")
+
+    parser.add_argument("--top_nodes",
+                        help="keep only this many most bought products (and as many "
+                             "sessions) in png visualization, 0 - all "
+                             f"(default: {VISUALIZATION_TOP_NODES})",
+                        type=int, default=VISUALIZATION_TOP_NODES)
+
+    parser.add_argument("--top_edges",
+                        help="keep only this many heaviest edges in png visualization",
+                        type=int, default=None)
+
+    parser.add_argument("--layouts",
+                        help="Graphviz layout engines of png visualization, rendered "
+                             "in parallel (default: dot)",
+                        nargs="+", default=["dot"])
+
+    parser.add_argument("--formats",
+                        help="image formats of png visualization (default: png)",
+                        nargs="+", default=["png"])
+
     parser.add_argument("--clear",
-                        help="clear current graph.json with preferences",
+                        help="clear current graph.jsonl with preferences",
+                        action="store_true")
+
+    parser.add_argument("--check_counts",
+                        help="check if products_power.json matches graph.jsonl",
+                        action="store_true")
+
+    parser.add_argument("--rebuild_counts",
+                        help="recalculate products_power.json from graph.jsonl",
+                        action="store_true")
+
+    parser.add_argument("--snapshot",
+                        help="save graph.jsonl as binary snapshot graph.bin now (it is also "
+                             "refreshed automatically when sessions are loaded)",
+                        action="store_true")
+
+    parser.add_argument("--serve",
+                        help="run recommendation service on unix socket trapezna.sock",
+                        action="store_true")
+
+    parser.add_argument("--port",
+                        help="run recommendation service on localhost TCP port instead",
+                        type=int, default=None)
+
+    parser.add_argument("--ranking",
+                        help="how to calculate products power (default: count)",
+                        choices=RANKING_MODES, default="count")
+
+    parser.add_argument("--storage",
+                        help="where sessions are kept (default: jsonl)",
+                        choices=STORAGE_BACKENDS, default="jsonl")
+
+    parser.add_argument("--half_life",
+                        help="half-life of purchase weight in days for decayed ranking "
+                             "(default: 14)",
+                        type=float, default=14)
+
+    parser.add_argument("--metrics",
+                        help="measure duration of pipeline stages, print report on exit "
+                             "and save it to --metrics_file (also TRAPEZNA_METRICS=1)",
+                        action="store_true")
+
+    parser.add_argument("--metrics_file",
+                        help="Prometheus text file for metrics (default: metrics.prom)",
+                        default="metrics.prom")
+
+    parser.add_argument("--profile_request",
+                        help="profile first purchase with cProfile and tracemalloc "
+                             "(saved to request.prof and request.mem.txt)",
                         action="store_true")
     # Get given parameters from terminal
     args = parser.parse_args()
 
+    use_storage(args.storage)
+
+    if args.metrics:
+        instrumentation.enable()
+    if args.profile_request:
+        # First call only shows ranking on start, second one is first purchase
+        instrumentation.capture_next("get_sorted_dishes", "request", skip=1)
+
     if args.visualization:
-        scene = create_scene(load_graph(GRAPH_FILE))
+        create_scene = get_backend("animation")
+        scene = create_scene(load_sessions(), args.since_last_render, args.max_nodes)
         scene.render(True)
     elif args.visualization_png:
-        generate_graph_png(organise_graph(load_graph(GRAPH_FILE)), "graph")
+        render_graph = get_backend("png")
+        for image in render_graph(iter_sessions, "graph", args.edges, args.top_nodes or None,
+                                  args.top_edges, args.layouts, args.formats,
+                                  source_key=ui.STORE.version()):
+            print(f"Saved {image}")
     elif args.clear:
         clear_graph()
+    elif args.check_counts:
+        print("Counts are consistent" if check_products_power()
+              else "Counts are inconsistent, run with --rebuild_counts")
+    elif args.serve:
+        # Modules that only one mode needs are imported by it, so other modes start faster
+        import asyncio
+        from recommendation_service import serve
+        asyncio.run(serve(ui.STORE, port=args.port))
+    elif args.snapshot:
+        from graph_snapshot import save_log_snapshot
+        sessions = len(save_log_snapshot(SESSION_LOG_FILE, SNAPSHOT_FILE))
+        print(f"Snapshot of {sessions} sessions saved to {SNAPSHOT_FILE}")
+    elif args.rebuild_counts:
+        _, sessions = rebuild_products_power()
+        print(f"Counts rebuilt from {sessions} sessions")
     else:
-        main_loop()
+        main_loop(ranking=args.ranking, half_life=args.half_life * 24 * 60 * 60)
+
+    if instrumentation.ENABLED:
+        print(instrumentation.report())
+        instrumentation.write_prometheus(args.metrics_file)
 
 if __name__ == "__main__":
     main()
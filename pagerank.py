@@ -0,0 +1,320 @@
+""" Module with PageRank over bipartite graph of sessions and products """
+
+from array import array
+
+import numpy as np
+
+from graph_logic import Graph
+from interning import Interner, CompactGraph
+
+# Positions of products added after index product -> sessions was built,
+# index is rebuilt when there are more of them
+_TAIL_EDGES = 1 << 16
+
+
+def build_adjacency(graph: Graph | CompactGraph) -> tuple[int, list[str], np.ndarray,
+                                                         np.ndarray, np.ndarray]:
+    """ Build compressed sparse adjacency (CSR) of bipartite `graph`.
+    Nodes are all sessions first (by id) and then all products.
+    Edge session-product goes in both directions, its weight
+    is number of times product appears in session. CSR arrays of
+    `CompactGraph` (or its snapshot) are read directly, names of
+    sessions are not needed.
+
+    Args:
+        graph (Graph | CompactGraph): graph with sessions and products connections
+
+    Returns:
+        tuple[int, list[str], np.ndarray, np.ndarray, np.ndarray]: number of
+            sessions, products, `indptr`, `indices` and `weights` of adjacency
+
+    Example:
+    >>> sessions, products, indptr, indices, weights = build_adjacency(\
+{"session_1": ["a", "b", "a"], "session_2": ["b"]})
+    >>> sessions, products, indptr.tolist(), indices.tolist(), weights.tolist()
+    (2, ['a', 'b'], [0, 2, 3, 4, 6], [2, 3, 3, 0, 0, 1], [2.0, 1.0, 1.0, 2.0, 1.0, 1.0])
+    """
+    if not isinstance(graph, CompactGraph):
+        graph = CompactGraph.from_graph(graph)
+    sessions, products = len(graph), len(graph.products)
+    offsets = _as_numpy(graph.offsets, np.uint64).astype(np.int64)
+    rows = np.repeat(np.arange(sessions, dtype=np.int64), np.diff(offsets))
+
+    # Edges session -> product, repeated product of session is one edge
+    edges, counts = np.unique(rows * max(products, 1) + _as_numpy(graph.indices, np.uint32),
+                              return_counts=True)
+    src, dst = edges // max(products, 1), sessions + edges % max(products, 1)
+
+    # Add reversed edges product -> session and sort by source node
+    src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+    weights = np.concatenate((counts, counts)).astype(np.float64)
+    order = np.argsort(src, kind="stable")
+    nodes = sessions + products
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=nodes))))
+    return sessions, graph.products.names, indptr, dst[order], weights[order]
+
+
+class PageRankEngine:
+    """ Iterative PageRank over graph of sessions and products.
+    Ranks of previous `run` are used as starting point of next one
+    (warm start), so after adding one session it converges in few iterations.
+    Sessions are only appended to store, so ranks of sessions are kept by id.
+
+    Attributes:
+        damping (float): probability to follow edge instead of random jump
+        tol (float): convergence tolerance (L1 norm of rank change)
+        max_iter (int): maximal number of iterations
+        iterations (int): number of iterations done by last `run`
+
+    Example:
+    >>> engine = PageRankEngine()
+    >>> graph = {"session_1": ["a", "b"], "session_2": ["a", "c"], "session_3": ["a"]}
+    >>> power = engine.run(graph)
+    >>> sorted(power, key=power.get, reverse=True)
+    ['a', 'b', 'c']
+    >>> round(power["b"], 6) == round(power["c"], 6)
+    True
+    >>> graph["session_4"] = ["c"]
+    >>> cold = PageRankEngine().run(graph)
+    >>> warm = engine.run(graph)
+    >>> all(abs(cold[product] - warm[product]) < 1e-5 for product in cold)
+    True
+    """
+    def __init__(self, damping: float = 0.85, tol: float = 1e-6, max_iter: int = 100):
+        self.damping = damping
+        self.tol = tol
+        self.max_iter = max_iter
+        self.iterations = 0
+        self._session_ranks = np.zeros(0)
+        self._product_ranks = {}
+
+    def _initial_ranks(self, sessions: int, products: list[str]) -> np.ndarray:
+        """ Start vector: ranks of previous run, new nodes get 1/N """
+        nodes = sessions + len(products)
+        ranks = np.full(nodes, 1 / nodes)
+        known = min(sessions, len(self._session_ranks))
+        ranks[:known] = self._session_ranks[:known]
+        for i, product in enumerate(products):
+            ranks[sessions + i] = self._product_ranks.get(product, ranks[sessions + i])
+        return ranks / ranks.sum()
+
+    def run(self, graph: Graph | CompactGraph) -> dict[str, float]:
+        """ Calculate PageRank of all nodes of `graph` by power iteration
+
+        Args:
+            graph (Graph | CompactGraph): graph with sessions and products connections
+
+        Returns:
+            dict[str, float]: dictionary where key is name of product
+                and value is its rank. Can be used as `products_power`
+                in `calculate_dishes_power`
+        """
+        sessions, products, indptr, indices, weights = build_adjacency(graph)
+        nodes = sessions + len(products)
+        self.iterations = 0
+        if nodes == 0:
+            return {}
+
+        # Source node of every stored edge, to multiply by rank of it
+        rows = np.repeat(np.arange(nodes), np.diff(indptr))
+        out_weight = np.bincount(rows, weights=weights, minlength=nodes)
+        dangling = out_weight == 0
+        transition = weights / out_weight[rows]
+
+        ranks = self._initial_ranks(sessions, products)
+        for self.iterations in range(1, self.max_iter + 1):
+            new_ranks = self.damping * np.bincount(indices, weights=ranks[rows] * transition,
+                                                   minlength=nodes)
+            # Rank of dangling nodes and random jumps spread uniformly
+            new_ranks += (self.damping * ranks[dangling].sum() + 1 - self.damping) / nodes
+            change = np.abs(new_ranks - ranks).sum()
+            ranks = new_ranks
+            if change < self.tol:
+                break
+
+        self._session_ranks = ranks[:sessions]
+        self._product_ranks = dict(zip(products, ranks[sessions:].tolist()))
+        return dict(self._product_ranks)
+
+
+class PersonalizedPageRank:
+    """ Personalized PageRank from given products, approximated by
+    Monte-Carlo random walks: every walk starts at start product, goes
+    product -> random session with it -> random product of that session
+    and stops with probability 1 - `damping` at every node. Rank of
+    product is share of walks that stopped at it (walks stopped at
+    sessions are not counted). Cost is O(`walks` /
+    (1 - damping)) steps whatever the size of graph and degree of start
+    products, because next session is sampled instead of visiting all of them.
+
+    Walks are advanced all at once with numpy. Sessions are kept in
+    `CompactGraph`, index product -> sessions is array of session ids
+    sorted by product (CSR). Sessions added later are kept in small tail
+    index, which is merged into main one when it grows to `_TAIL_EDGES`.
+
+    Attributes:
+        damping (float): probability to continue walk
+        walks (int): number of walks of one `run`. More - more accurate, slower
+        seed (int): seed of random walks, so the same graph gives the same ranks
+        graph (CompactGraph | None): loaded sessions
+        touched (int): number of walk steps done by last `run`
+
+    Example:
+    >>> engine = PersonalizedPageRank()
+    >>> engine.load({"session_1": ["a", "b"], "session_2": ["c", "d"], "session_3": ["b", "e"]})
+    >>> power = engine.run(["a"])
+    >>> sorted(power, key=power.get, reverse=True)
+    ['a', 'b', 'e']
+    >>> engine.add_session("session_4", ["e", "d"])
+    >>> sorted(engine.run(["a"]))
+    ['a', 'b', 'c', 'd', 'e']
+    >>> engine.run(["unknown"])
+    {}
+
+    Cost doesnt depend on size of graph or degree of start product:
+    >>> import time
+    >>> rng = np.random.default_rng(0)
+    >>> sessions = 1_000_000
+    >>> hub = np.zeros((sessions, 1), dtype=np.uint32)
+    >>> indices = np.hstack([hub, rng.integers(1, 5000, (sessions, 4), dtype=np.uint32)])
+    >>> engine.load(CompactGraph(Interner(f"product_{i}" for i in range(5000)), Interner(),
+    ...                          array('Q', range(0, 5 * sessions + 1, 5)),
+    ...                          array('I', indices.ravel().tobytes())))
+    >>> start = time.perf_counter()
+    >>> power = engine.run(["product_0"])
+    >>> time.perf_counter() - start < 0.1, engine.touched < 3 * engine.walks / (1 - engine.damping)
+    (True, True)
+    """
+    def __init__(self, damping: float = 0.85, walks: int = 4000, seed: int = 0):
+        self.damping = damping
+        self.walks = walks
+        self.seed = seed
+        self.graph = None
+        self.touched = 0
+        self._order = np.zeros(0, dtype=np.uint64)
+        self._order_indptr = np.zeros(1, dtype=np.int64)
+        self._tail = None
+
+    def load(self, graph: Graph | CompactGraph):
+        """ Load sessions of `graph` and build index product -> sessions.
+        `CompactGraph` is used as is, without translating names.
+
+        Args:
+            graph (Graph | CompactGraph): graph with sessions and products connections
+        """
+        self.graph = graph if isinstance(graph, CompactGraph) else CompactGraph.from_graph(graph)
+        self._build_index()
+
+    def _build_index(self):
+        """ Sort sessions of all products (O(edges log edges)) """
+        self._order, self._order_indptr = self._sort_sessions(0)
+        self._tail = None
+
+    def _sort_sessions(self, first: int) -> tuple[np.ndarray, np.ndarray]:
+        """ Return session of every position of `graph.indices` from `first`
+        on, sorted by product, and start of sessions of every product in them
+        """
+        offsets = _as_numpy(self.graph.offsets, np.uint64)
+        indices = _as_numpy(self.graph.indices, np.uint32)[first:]
+        first_session = int(np.searchsorted(offsets, np.uint64(first), side="right")) - 1
+        sessions = np.repeat(np.arange(first_session, len(offsets) - 1, dtype=np.uint32),
+                             np.diff(offsets[first_session:]).astype(np.int64))
+        sessions = sessions[first - int(offsets[first_session]):]
+        order = sessions[np.argsort(indices, kind="stable")]
+        indptr = np.concatenate(
+            ([0], np.cumsum(np.bincount(indices, minlength=len(self.graph.products)))))
+        return order, indptr
+
+    def add_session(self, session: str, products: list[str]):
+        """ Add one session to loaded graph in O(len(products))
+
+        Args:
+            session (str): name of session
+            products (list[str]): products from session
+        """
+        if self.graph is None:
+            self.load({})
+        self.graph.add_session(products, session)
+        self._tail = None
+        if len(self.graph.indices) - len(self._order) > _TAIL_EDGES:
+            self._build_index()
+
+    def _sample_sessions(self, products: np.ndarray, uniform: np.ndarray) -> np.ndarray:
+        """ Return random session with every product of `products`
+        (session with product several times is more likely)
+        """
+        if self._tail is None:
+            # Index of sessions added since main index was built, it is small
+            self._tail = self._sort_sessions(len(self._order))
+        tail_order, tail_indptr = self._tail
+        # Products added after main index was built have no sessions in it
+        indptr = self._order_indptr
+        if len(indptr) < len(tail_indptr):
+            indptr = np.concatenate((indptr, np.full(len(tail_indptr) - len(indptr), indptr[-1])))
+        first = indptr[products]
+        degree = indptr[products + 1] - first
+        tail_first = tail_indptr[products]
+        tail_degree = tail_indptr[products + 1] - tail_first
+        choice = (uniform * (degree + tail_degree)).astype(np.int64)
+        in_order = choice < degree
+        return np.where(in_order,
+                        self._order[np.where(in_order, first + choice, 0)] if len(self._order)
+                        else 0,
+                        tail_order[np.where(in_order, 0, tail_first + choice - degree)]
+                        if len(tail_order) else 0)
+
+    def run(self, products: list[str]) -> dict[str, float]:
+        """ Calculate personalized PageRank of products, starting
+        random walks from `products`
+
+        Args:
+            products (list[str]): start products (e.g. from selected dishes)
+
+        Returns:
+            dict[str, float]: dictionary where key is name of reached product
+                and value is its rank. Can be used as `products_power`
+                in `calculate_dishes_power`
+        """
+        self.touched = 0
+        if self.graph is None:
+            return {}
+        product_ids = self.graph.products.ids
+        start = np.array([product_ids[product] for product in products if product in product_ids],
+                         dtype=np.int64)
+        if not len(start):
+            return {}
+        rng = np.random.default_rng(self.seed)
+        offsets = _as_numpy(self.graph.offsets, np.uint64)
+        indices = _as_numpy(self.graph.indices, np.uint32)
+
+        stops = np.zeros(len(self.graph.products), dtype=np.int64)
+        walkers = start[np.arange(self.walks) % len(start)]
+        while len(walkers):
+            self.touched += len(walkers)
+            stop = rng.random(len(walkers)) >= self.damping
+            stops += np.bincount(walkers[stop], minlength=len(stops))
+            walkers = walkers[~stop]
+            # Product -> random session with it -> random product of that session
+            sessions = self._sample_sessions(walkers, rng.random(len(walkers)))
+            self.touched += len(sessions)
+            sessions = sessions[rng.random(len(sessions)) < self.damping]
+            first = offsets[sessions]
+            size = offsets[sessions + 1] - first
+            walkers = indices[first + (rng.random(len(sessions)) * size).astype(np.uint64)]
+            walkers = walkers.astype(np.int64)
+        # Views of arrays of graph are released, so it can grow again
+        del offsets, indices
+        names = self.graph.products.names
+        return {names[product]: count / self.walks
+                for product, count in enumerate(stops.tolist()) if count}
+
+def _as_numpy(values: array | np.ndarray, dtype) -> np.ndarray:
+    """ View array of `CompactGraph` (or of its snapshot) as numpy array without copying """
+    if isinstance(values, np.ndarray):
+        return values
+    return np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype=dtype)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
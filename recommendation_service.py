@@ -0,0 +1,282 @@
+""" Module with local recommendation service, so several POS terminals
+can share one warm process instead of each loading sessions and menu.
+
+Protocol: one json object per line, response is one json object per line.
+    {"op": "record", "dishes": ["Борщ з мʼясом", "Компот"]}
+        -> {"session": "session_7"}
+    {"op": "ranked", "k": 5}
+        -> {"dishes": [[...], [...], [...]]}   (best `k` dishes of every type)
+    {"op": "also", "dishes": ["Борщ з мʼясом"], "k": 3}
+        -> {"dishes": [...]}   (`k` dishes most often ordered together with given)
+    anything wrong -> {"error": "..."}
+
+Requests that come within `window` seconds are processed together:
+all new sessions are written in one batch and dishes are scored once.
+Malformed requests are answered right away and never get into batch.
+"""
+
+import asyncio
+import json
+import socket
+import time
+
+import graph_logic
+import dish_scoring
+from cooccurrence import CooccurrenceIndex
+from session_store import SessionStore
+
+# Default path of unix socket of service
+SOCKET_FILE = "trapezna.sock"
+# Neighbours kept for every product in index of products ordered together
+COOCCURRENCE_TOP_N = 50
+
+
+class RecommendationService:
+    """ Service state: storage, products power and menu loaded once
+    and kept in memory, plus queue of requests waiting for next batch
+
+    Attributes:
+        store (SessionStore): where new sessions are saved
+        window (float): how long to wait for more requests before batch (seconds)
+        products_power (dict[str, int]): aggregated products power of all sessions
+        cooccurrence (CooccurrenceIndex): products ordered together in all sessions
+        batches (int): number of processed batches
+
+    Example:
+    >>> import os, tempfile
+    >>> from session_store import JsonLogStore
+    >>> folder = tempfile.mkdtemp()
+    >>> service = RecommendationService(JsonLogStore(os.path.join(folder, "graph.jsonl"), \
+os.path.join(folder, "products_power.json")))
+    >>> async def three_clients():
+    ...     return await asyncio.gather(
+    ...         service.submit({"op": "record", "dishes": ["Крем суп з броколі"]}),
+    ...         service.submit({"op": "record", "dishes": ["Суші"]}),
+    ...         service.submit({"op": "ranked", "k": 1}))
+    >>> asyncio.run(three_clients())
+    [{'session': 'session_1'}, {'error': "Unknown dish 'Суші'"}, \
+{'dishes': [['Крем суп з броколі'], ['Курка запечена з броколі'], ['Компот']]}]
+    >>> service.batches
+    1
+    >>> async def bad_clients():
+    ...     return await asyncio.gather(
+    ...         service.submit({"op": "record"}),
+    ...         service.submit({"op": "ranked", "k": "3"}),
+    ...         service.submit([1, 2]),
+    ...         service.submit({"op": "ranked", "k": 0}))
+    >>> asyncio.run(bad_clients())
+    [{'error': 'Invalid request: "dishes" must be list of dish names'}, \
+{'error': 'Invalid request: "k" must be non-negative integer'}, \
+{'error': 'Invalid request: request must be json object'}, {'dishes': [[], [], []]}]
+    >>> async def also_ordered():
+    ...     await service.submit({"op": "record", "dishes": ["Крем суп з броколі", "Компот"]})
+    ...     return await service.submit({"op": "also", "dishes": ["Крем суп з броколі"], "k": 1})
+    >>> asyncio.run(also_ordered())
+    {'dishes': ['Компот']}
+    >>> counts_time = os.stat(os.path.join(folder, "products_power.json")).st_mtime_ns
+    >>> asyncio.run(service.submit({"op": "ranked", "k": 0}))
+    {'dishes': [[], [], []]}
+    >>> os.stat(os.path.join(folder, "products_power.json")).st_mtime_ns == counts_time
+    True
+
+    Batches run in executor thread, SQLite storage works there too:
+    >>> from session_store import SqliteStore
+    >>> sqlite_service = RecommendationService(SqliteStore(os.path.join(folder, "graph.sqlite")))
+    >>> asyncio.run(sqlite_service.submit({"op": "record", "dishes": ["Компот"]}))
+    {'session': 'session_1'}
+    """
+    def __init__(self, store: SessionStore, window: float = 0.005):
+        self.store = store
+        self.window = window
+        self.products_power, _ = store.load_products_power()
+        self.cooccurrence = CooccurrenceIndex.from_graph(store.iter_sessions(),
+                                                         COOCCURRENCE_TOP_N)
+        self.batches = 0
+        self._pending = []
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    async def submit(self, message: dict) -> dict:
+        """ Add request to next batch and wait for its response
+
+        Args:
+            message (dict): request (see module description)
+
+        Returns:
+            dict: response
+
+        Raises:
+            Exception: error of storage, if batch with request failed
+        """
+        if (error := validate_request(message)) is not None:
+            return {"error": f"Invalid request: {error}"}
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        pending, self._pending, self._flush_task = self._pending, [], None
+        # Batches are processed one by one, because they change products power
+        async with self._lock:
+            try:
+                responses = await asyncio.get_running_loop().run_in_executor(
+                    None, self.process_batch, [message for message, _ in pending])
+            except Exception as error:
+                # Every client of failed batch gets error instead of waiting forever
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+        for (_, future), response in zip(pending, responses):
+            # Future is cancelled if client disconnected while waiting
+            if not future.done():
+                future.set_result(response)
+
+    def process_batch(self, messages: list[dict]) -> list[dict]:
+        """ Process several requests: save all new sessions in one batch,
+        then score dishes once for all ranking requests
+
+        Args:
+            messages (list[dict]): requests (see module description),
+                checked by `validate_request`
+
+        Returns:
+            list[dict]: response to every request
+        """
+        self.batches += 1
+        responses = [None] * len(messages)
+        new_sessions = []
+        now = time.time()
+        for i, message in enumerate(messages):
+            if message["op"] in ("record", "also"):
+                menu = graph_logic.get_menu_index()
+                unknown = [dish for dish in message["dishes"] if dish not in menu.dish_type]
+                if unknown:
+                    responses[i] = {"error": f"Unknown dish {unknown[0]!r}"}
+                elif message["op"] == "record":
+                    new_sessions.append((i, graph_logic.dishes_to_products(message["dishes"])))
+
+        # Batch of ranking requests only reads, store isnt touched
+        names = self.store.add_sessions([(products, now) for _, products in new_sessions]) \
+            if new_sessions else []
+        for (i, products), name in zip(new_sessions, names):
+            graph_logic.update_products_power(self.products_power, products)
+            self.cooccurrence.add_session(products)
+            responses[i] = {"session": name}
+
+        # Sessions of this batch are already counted
+        all_dishes = len(graph_logic.get_menu_index().dish_type)
+        for i, message in enumerate(messages):
+            if responses[i] is None and message["op"] == "also":
+                k = message.get("k")
+                responses[i] = {"dishes": self.cooccurrence.also_ordered_dishes(
+                    message["dishes"], all_dishes if k is None else k)}
+
+        # Only ranking requests are left without response
+        ranked = [i for i, response in enumerate(responses) if response is None]
+        if ranked:
+            typed_dishes = graph_logic.top_dishes_by_type(
+                dish_scoring.calculate_dishes_power(self.products_power),
+                max(messages[i].get("k") or all_dishes for i in ranked))
+            for i in ranked:
+                k = messages[i].get("k")
+                responses[i] = {"dishes": [list(dishes[:k]) for dishes in typed_dishes]}
+        return responses
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ Answer requests of one connection, line by line """
+        while line := await reader.readline():
+            try:
+                response = await self.submit(json.loads(line))
+            except json.JSONDecodeError as error:
+                response = {"error": f"Invalid request: {error}"}
+            except Exception as error:
+                # Storage failed, connection stays open for next requests
+                response = {"error": f"Request failed: {error}"}
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+        writer.close()
+
+
+def validate_request(message) -> str | None:
+    """ Check that request has known operation and arguments of right types
+
+    Args:
+        message: decoded json of request
+
+    Returns:
+        str | None: description of problem, None if request is valid
+
+    Example:
+    >>> validate_request({"op": "record", "dishes": ["Борщ"]}) is None
+    True
+    >>> validate_request({"op": "record", "dishes": "Борщ"})
+    '"dishes" must be list of dish names'
+    >>> validate_request({"op": "ranked", "k": True})
+    '"k" must be non-negative integer'
+    >>> validate_request({"op": "delete"})
+    "Unknown operation 'delete'"
+    """
+    if not isinstance(message, dict):
+        return "request must be json object"
+    op = message.get("op")
+    if op not in ("record", "ranked", "also"):
+        return f"Unknown operation {op!r}"
+    if op in ("record", "also"):
+        dishes = message.get("dishes")
+        if not isinstance(dishes, list) or not all(isinstance(dish, str) for dish in dishes):
+            return '"dishes" must be list of dish names'
+    if op in ("ranked", "also"):
+        k = message.get("k")
+        # bool is subclass of int, but true is not number of dishes
+        if k is not None and (not isinstance(k, int) or isinstance(k, bool) or k < 0):
+            return '"k" must be non-negative integer'
+    return None
+
+async def serve(store: SessionStore, path: str = SOCKET_FILE, port: int | None = None,
+                window: float = 0.005):
+    """ Run service forever on unix socket `path`,
+    or on localhost TCP `port` if it is given
+
+    Args:
+        store (SessionStore): where sessions are kept
+        path (str, optional): path of unix socket. Defaults to `SOCKET_FILE`.
+        port (int | None, optional): TCP port. Defaults to None.
+        window (float, optional): batching window (seconds). Defaults to 0.005.
+    """
+    service = RecommendationService(store, window)
+    if port is not None:
+        server = await asyncio.start_server(service.handle_client, "127.0.0.1", port)
+    else:
+        server = await asyncio.start_unix_server(service.handle_client, path)
+    async with server:
+        await server.serve_forever()
+
+def send_request(message: dict, path: str = SOCKET_FILE, port: int | None = None) -> dict:
+    """ Send one request to running service and return its response
+
+    Args:
+        message (dict): request (see module description)
+        path (str, optional): path of unix socket. Defaults to `SOCKET_FILE`.
+        port (int | None, optional): TCP port. Defaults to None.
+
+    Returns:
+        dict: response
+    """
+    if port is not None:
+        connection = socket.create_connection(("127.0.0.1", port))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
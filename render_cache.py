@@ -0,0 +1,203 @@
+""" Module with cache of rendered graph images. Images are kept under
+hash of version of session store (or DOT source of graph) and render
+options, so unchanged graph is never laid out by Graphviz twice.
+Missing images are rendered in process pool, several at once.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import TextIO
+
+import graphviz
+
+from graph_visualization_png import weighted_edges, prune_edges, write_dot, SessionSource
+
+# Folder with cached images
+RENDER_CACHE_DIR = ".render_cache"
+# Cache is shrunk to this size (bytes) after every new image
+RENDER_CACHE_SIZE = 64 * 2 ** 20
+
+
+class RenderCache:
+    """ Folder with images named by their key. When total size is bigger
+    than `max_bytes`, least recently used images are removed.
+
+    Attributes:
+        folder (str): path of cache folder
+        max_bytes (int): maximal total size of images
+
+    Example:
+    >>> cache = RenderCache(tempfile.mkdtemp(), max_bytes=10)
+    >>> def image(text):
+    ...     path = os.path.join(tempfile.mkdtemp(), "image")
+    ...     with open(path, "w") as f:
+    ...         _ = f.write(text)
+    ...     return path
+    >>> cache.get("a", "png") is None
+    True
+    >>> path = cache.put("a", "png", image("123456"))
+    >>> cache.get("a", "png") == path
+    True
+    >>> _ = cache.put("b", "png", image("123456"))
+    >>> cache.get("a", "png") is None, cache.get("b", "png") is None
+    (True, False)
+    """
+    def __init__(self, folder: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_SIZE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key: str, file_format: str) -> str:
+        """ Return path of image with `key` and `file_format` in cache """
+        return os.path.join(self.folder, f"{key}.{file_format}")
+
+    def get(self, key: str, file_format: str) -> str | None:
+        """ Return path of cached image, or None if it isnt cached.
+        Image is marked as recently used.
+        """
+        path = self.path(key, file_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, file_format: str, filename: str) -> str:
+        """ Move rendered image `filename` into cache and evict old images
+
+        Returns:
+            str: path of image in cache
+        """
+        path = self.path(key, file_format)
+        os.replace(filename, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: str | None = None):
+        """ Remove least recently used images until cache fits into `max_bytes`
+        (image `keep` is never removed)
+        """
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+
+def render_dot(dot_file: str, engine: str, file_format: str, outfile: str) -> str:
+    """ Render DOT file with Graphviz `engine` (runs in worker process)
+
+    Returns:
+        str: path of rendered image
+    """
+    return graphviz.render(engine, file_format, dot_file, outfile=outfile)
+
+class _HashingWriter:
+    """ Text file wrapper that hashes everything written into it """
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.hash = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        self.hash.update(text.encode("utf-8"))
+        return self.file.write(text)
+
+def render_graph(graph: SessionSource, output_file: str = "graph",
+                 mode: str = "session", top_nodes: int | None = None,
+                 top_edges: int | None = None, layouts: list[str] | None = None,
+                 formats: list[str] | None = None, cache: RenderCache | None = None,
+                 source_key: str | None = None) -> list[str]:
+    """ Save images of graph with weighted edges (see
+    `graph_visualization_png.generate_weighted_graph_png`) for every
+    combination of layout engine and format. Cached images are copied,
+    missing ones are rendered in parallel in process pool and cached.
+
+    With `source_key` images are looked up before graph is read, so when
+    all of them are cached, sessions are not read at all. Otherwise key
+    is hash of DOT source, computed while it is written.
+
+    Args:
+        graph (dict[str, list[str]] | CompactGraph | Callable[[], SessionStream]):
+            graph to vizualize, see `weighted_edges`
+        output_file (str): path of image without extension. When several
+            layouts are given, name of layout is added to it ("graph_sfdp.svg")
+        mode (str): kind of edges, see `weighted_edges`
+        top_nodes (int | None): number of kept nodes, see `weighted_edges`
+        top_edges (int | None): number of kept edges, None - all
+        layouts (list[str] | None): Graphviz engines. Defaults to ["dot"].
+        formats (list[str] | None): image formats. Defaults to ["png"].
+        cache (RenderCache | None): cache of images. Defaults to `RenderCache()`.
+        source_key (str | None): token that changes with graph,
+            e.g. `SessionStore.version()`. Defaults to None.
+
+    Returns:
+        list[str]: paths of saved images
+    """
+    layouts = layouts or ["dot"]
+    formats = formats or ["png"]
+    cache = cache or RenderCache()
+
+    def lookup(source: str) -> tuple[list[str], list[tuple[str, str, str, str]]]:
+        """ Copy cached images, return all images and (key, layout, format,
+        image) of images that are not cached
+        """
+        images = []
+        missing = []
+        for layout in layouts:
+            for file_format in formats:
+                key = hashlib.sha256(f"{source}:{layout}".encode()).hexdigest()
+                suffix = f"_{layout}" if len(layouts) > 1 else ""
+                image = f"{output_file}{suffix}.{file_format}"
+                images.append(image)
+                if (cached := cache.get(key, file_format)) is not None:
+                    shutil.copyfile(cached, image)
+                else:
+                    missing.append((key, layout, file_format, image))
+        return images, missing
+
+    if source_key is not None:
+        source_key = f"{source_key}:{mode}:{top_nodes}:{top_edges}"
+        images, missing = lookup(source_key)
+        if not missing:
+            return images
+
+    folder = tempfile.mkdtemp(dir=cache.folder)
+    try:
+        dot_file = os.path.join(folder, "graph.gv")
+        with open(dot_file, "w", encoding="utf-8") as file:
+            writer = _HashingWriter(file)
+            write_dot(prune_edges(weighted_edges(graph, mode, top_nodes), top_edges),
+                      writer, directed=mode == "session")
+        if source_key is None:
+            images, missing = lookup(writer.hash.hexdigest())
+
+        rendered = [os.path.join(folder, f"{key}.{file_format}")
+                    for key, _, file_format, _ in missing]
+        if len(missing) == 1:
+            render_dot(dot_file, missing[0][1], missing[0][2], rendered[0])
+        elif missing:
+            with ProcessPoolExecutor(min(len(missing), os.cpu_count() or 1)) as pool:
+                list(pool.map(render_dot, [dot_file] * len(missing),
+                              [layout for _, layout, _, _ in missing],
+                              [file_format for _, _, file_format, _ in missing], rendered))
+        for (key, _, file_format, image), path in zip(missing, rendered):
+            shutil.copyfile(path, image)
+            cache.put(key, file_format, path)
+        return images
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -0,0 +1,585 @@
+""" Module with storage backends for sessions and aggregated products power.
+All backends have the same interface (`SessionStore`), so UI doesnt
+depend on where sessions are kept.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import graph_logic
+from graph_logic import Graph
+from interning import CompactGraph
+
+
+class SessionStore(ABC):
+    """ Interface of storage of sessions. Backends implement all abstract
+    methods, so backend that misses one cant be created
+
+    Example:
+    >>> class HalfStore(SessionStore):
+    ...     def load_graph(self, session_times=None):
+    ...         return {}
+    >>> HalfStore()  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+        ...
+    TypeError: Can't instantiate abstract class HalfStore ...
+    """
+    @abstractmethod
+    def load_graph(self, session_times: dict[str, float] | None = None) -> Graph:
+        """ Return graph with all stored sessions
+
+        Args:
+            session_times (dict[str, float] | None, optional): if given, it is
+                filled with time of every session that has it. Defaults to None.
+
+        Returns:
+            Graph: graph with all sessions
+        """
+
+    def load_compact_graph(self) -> CompactGraph:
+        """ Return all stored sessions as `CompactGraph` (ids and CSR arrays
+        instead of names), for consumers that dont need names of sessions
+
+        Returns:
+            CompactGraph: graph with all sessions
+        """
+        return CompactGraph.from_graph(self.load_graph())
+
+    @abstractmethod
+    def iter_sessions(self, session_times: dict[str, float] | None = None
+                      ) -> Iterator[tuple[str, list[str]]]:
+        """ Read stored sessions one by one (in order they were added),
+        without loading all of them
+
+        Args:
+            session_times (dict[str, float] | None, optional): if given, it is
+                filled with time of every read session that has it. Defaults to None.
+
+        Yields:
+            tuple[str, list[str]]: name of session and its products
+        """
+
+    @abstractmethod
+    def iter_sessions_after(self, position: int, session_times: dict[str, float] | None = None
+                            ) -> Iterator[tuple[str, list[str], int]]:
+        """ Read sessions stored after `position`, in time that depends only
+        on number of read sessions, not on number of sessions before it
+
+        Args:
+            position (int): 0 (read all sessions), `position()` or position
+                given with last read session
+            session_times (dict[str, float] | None, optional): if given, it is
+                filled with time of every read session that has it. Defaults to None.
+
+        Yields:
+            tuple[str, list[str], int]: name of session, its products
+                and position after it
+        """
+
+    @abstractmethod
+    def position(self) -> int:
+        """ Return position after last stored session (see `iter_sessions_after`),
+        without reading sessions
+        """
+
+    @abstractmethod
+    def save_graph(self, graph: Graph, session_times: dict[str, float] | None = None):
+        """ Replace all stored sessions with sessions of `graph`
+
+        Args:
+            graph (Graph): graph to save
+            session_times (dict[str, float] | None, optional): time of sessions
+        """
+
+    @abstractmethod
+    def add_sessions(self, sessions: list[tuple[list[str], float | None]]) -> list[str]:
+        """ Add several sessions at once
+
+        Args:
+            sessions (list[tuple[list[str], float | None]]): products and time
+                of every new session
+
+        Returns:
+            list[str]: names given to new sessions
+        """
+
+    def add_session(self, products: list[str], timestamp: float | None = None) -> str:
+        """ Add one session with `products`
+
+        Args:
+            products (list[str]): products from new session
+            timestamp (float | None, optional): time of session (unix time)
+
+        Returns:
+            str: name given to new session
+        """
+        return self.add_sessions([(products, timestamp)])[0]
+
+    @abstractmethod
+    def load_products_power(self) -> tuple[dict[str, int], int]:
+        """ Return aggregated products power and number of sessions in it """
+
+    @abstractmethod
+    def rebuild_products_power(self) -> tuple[dict[str, int], int]:
+        """ Recalculate aggregated products power from all sessions """
+
+    @abstractmethod
+    def check_products_power(self) -> bool:
+        """ Check if aggregated products power is consistent with sessions """
+
+    @abstractmethod
+    def clear(self):
+        """ Remove all sessions """
+
+    @abstractmethod
+    def version(self) -> str:
+        """ Return cheap token that changes whenever stored sessions change,
+        without reading sessions (used as key of cached visualizations)
+        """
+
+
+def _write_atomically(filename: str, text: str):
+    """ Replace content of file, so reader never sees half-written file """
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_file, filename)
+
+
+class JsonLogStore(SessionStore):
+    """ Sessions in append-only json lines log, aggregated products power
+    in json sidecar file. Old json graph file is migrated into log once.
+    If `snapshot_file` is given, graph is loaded from binary snapshot of log
+    and only sessions appended after it are parsed (see graph_snapshot.py).
+    Suitable for one terminal: concurrent writers are not synchronized.
+
+    New session is named by number of counted sessions. If the last
+    logged session is not the last counted one (program crashed after
+    logging purchase, before counts were saved), counts are rebuilt
+    first, so name of logged session is never given again.
+
+    Example:
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> store = JsonLogStore(os.path.join(folder, "graph.jsonl"),
+    ...                      os.path.join(folder, "products_power.json"))
+    >>> store.add_sessions([(["a", "b"], None), (["b"], None)])
+    ['session_1', 'session_2']
+    >>> graph_logic.append_session_record("session_3", ["c"], store.log_file)
+    >>> store.check_products_power()
+    False
+    >>> store.add_session(["a"])
+    'session_4'
+    >>> store.load_products_power()
+    ({'a': 2, 'b': 2, 'c': 1}, 4)
+    >>> store.check_products_power()
+    True
+
+    Purchase after upgrade keeps sessions of old graph file:
+    >>> graph_logic.save_graph({"session_1": ["a"], "session_2": ["b"]},
+    ...                        os.path.join(folder, "graph.json"))
+    >>> store = JsonLogStore(os.path.join(folder, "new.jsonl"),
+    ...                      os.path.join(folder, "new_power.json"),
+    ...                      os.path.join(folder, "graph.json"))
+    >>> store.load_products_power()
+    ({'a': 1, 'b': 1}, 2)
+    >>> store.add_session(["c"])
+    'session_3'
+    >>> store.load_graph()
+    {'session_1': ['a'], 'session_2': ['b'], 'session_3': ['c']}
+    >>> store.rebuild_products_power()
+    ({'a': 1, 'b': 1, 'c': 1}, 3)
+
+    With snapshot, compact graph reads its arrays without translating names:
+    >>> store.snapshot_file = os.path.join(folder, "graph.bin")
+    >>> store.load_compact_graph().offsets.tolist()
+    [0, 1, 2, 3]
+    """
+    def __init__(self, log_file: str, counts_file: str, legacy_file: str | None = None,
+                 snapshot_file: str | None = None):
+        self.log_file = log_file
+        self.counts_file = counts_file
+        self.legacy_file = legacy_file
+        self.snapshot_file = snapshot_file
+
+    def _ensure_log(self):
+        """ Migrate old graph file into log before log is first read or
+        appended, so sessions of upgraded install are never lost
+        """
+        if not os.path.exists(self.log_file) and self.legacy_file \
+                and os.path.exists(self.legacy_file):
+            graph_logic.migrate_graph_to_log(self.legacy_file, self.log_file)
+
+    def load_graph(self, session_times=None):
+        self._ensure_log()
+        # Snapshot doesnt keep time of sessions
+        if self.snapshot_file and session_times is None:
+            import graph_snapshot  # needs numpy, other modes dont load it
+            return graph_snapshot.load_log_with_snapshot(self.log_file, self.snapshot_file)
+        return graph_logic.load_session_log(self.log_file, session_times)
+
+    def load_compact_graph(self):
+        if not self.snapshot_file:
+            return super().load_compact_graph()
+        self._ensure_log()
+        import graph_snapshot
+        return graph_snapshot.load_compact_log_with_snapshot(self.log_file, self.snapshot_file)
+
+    def iter_sessions(self, session_times=None):
+        self._ensure_log()
+        return graph_logic.iter_session_log(self.log_file, session_times)
+
+    def iter_sessions_after(self, position, session_times=None):
+        # Position is offset in log file
+        self._ensure_log()
+        return graph_logic.iter_session_records(self.log_file, session_times, position)
+
+    def position(self):
+        self._ensure_log()
+        return graph_logic.session_log_end(self.log_file)
+
+    def save_graph(self, graph, session_times=None):
+        tmp_file = self.log_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8"):
+            pass
+        for session, products in graph.items():
+            graph_logic.append_session_record(session, products, tmp_file,
+                                              (session_times or {}).get(session))
+        os.replace(tmp_file, self.log_file)
+        self._remove_snapshot()
+        self.rebuild_products_power()
+
+    def add_sessions(self, sessions):
+        self._ensure_log()
+        products_power, sessions_count = self.load_products_power()
+        if graph_logic.last_session_name(self.log_file) != \
+                (f"session_{sessions_count}" if sessions_count else None):
+            products_power, sessions_count = self.rebuild_products_power()
+        names = []
+        for products, timestamp in sessions:
+            sessions_count += 1
+            names.append(f"session_{sessions_count}")
+            graph_logic.append_session_record(names[-1], products, self.log_file, timestamp)
+            graph_logic.update_products_power(products_power, products)
+        graph_logic.save_products_power(products_power, sessions_count, self.counts_file)
+        return names
+
+    def load_products_power(self):
+        if not os.path.exists(self.counts_file):
+            return self.rebuild_products_power()
+        return graph_logic.load_products_power(self.counts_file)
+
+    def rebuild_products_power(self):
+        sessions = 0
+        def count_sessions():
+            nonlocal sessions
+            for session in self.iter_sessions():
+                sessions += 1
+                yield session
+        products_power = graph_logic.calculate_products_power(count_sessions())
+        graph_logic.save_products_power(products_power, sessions, self.counts_file)
+        return products_power, sessions
+
+    def check_products_power(self):
+        if not os.path.exists(self.counts_file):
+            return False
+        products_power, sessions = graph_logic.load_products_power(self.counts_file)
+        return graph_logic.check_products_power(self.iter_sessions(), products_power, sessions)
+
+    def clear(self):
+        if self.legacy_file:
+            _write_atomically(self.legacy_file, "{\n}")
+        _write_atomically(self.log_file, "")
+        self._remove_snapshot()
+        graph_logic.save_products_power({}, 0, self.counts_file)
+
+    def version(self):
+        # Log is only appended or replaced, both change its size or mtime
+        self._ensure_log()
+        try:
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            return "jsonl:empty"
+        return f"jsonl:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _remove_snapshot(self):
+        """ Remove snapshot of log that was rewritten """
+        if self.snapshot_file and os.path.exists(self.snapshot_file):
+            os.remove(self.snapshot_file)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    time REAL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_products (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    position INTEGER NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    PRIMARY KEY (session_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS session_products_product ON session_products(product_id);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+"""
+
+
+class SqliteStore(SessionStore):
+    """ Sessions and aggregated products power in SQLite database in WAL mode.
+    Several processes (terminals) can use one database at the same time:
+    readers dont block writer, writers are serialized by SQLite, and
+    session with its products and counts is written in one transaction.
+    Every thread uses its own connection, so one store can be shared by
+    UI, its background worker and threads of recommendation service.
+
+    Example:
+    >>> import tempfile
+    >>> store = SqliteStore(os.path.join(tempfile.mkdtemp(), "graph.sqlite"))
+    >>> store.add_sessions([(["a", "b", "a"], 1.0), (["b"], None)])
+    ['session_1', 'session_2']
+    >>> session_times = {}
+    >>> store.load_graph(session_times), session_times
+    ({'session_1': ['a', 'b', 'a'], 'session_2': ['b']}, {'session_1': 1.0})
+    >>> store.load_products_power()
+    ({'a': 2, 'b': 2}, 2)
+    >>> store.check_products_power()
+    True
+    >>> list(store.iter_sessions())
+    [('session_1', ['a', 'b', 'a']), ('session_2', ['b'])]
+    >>> store.load_compact_graph().indices
+    array('I', [0, 1, 0, 1])
+    >>> position = store.position()
+    >>> store.add_session(["c"], 3.0)
+    'session_3'
+    >>> session_times = {}
+    >>> list(store.iter_sessions_after(position, session_times)), session_times
+    ([('session_3', ['c'], 3)], {'session_3': 3.0})
+    >>> version = store.version()
+    >>> store.clear()
+    >>> store.load_graph(), store.load_products_power(), store.version() != version
+    ({}, ({}, 0), True)
+    >>> thread = threading.Thread(target=store.add_session, args=(["c"],))
+    >>> thread.start(), thread.join()
+    (None, None)
+    >>> store.load_graph()
+    {'session_1': ['c']}
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._local = threading.local()
+        self._connection.executescript(_SQLITE_SCHEMA)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of current thread, opened by its first call
+        (sqlite3 connection can be used only in thread that opened it)
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are started manually, see `_transaction`
+            connection = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self, mode: str = "IMMEDIATE"):
+        """ Run block in transaction. IMMEDIATE takes write lock right away,
+        DEFERRED is enough for reading consistent snapshot.
+        Every write transaction increments version of store (see `version`).
+        """
+        self._connection.execute(f"BEGIN {mode}")
+        try:
+            yield self._connection
+            if mode == "IMMEDIATE":
+                self._connection.execute(
+                    "INSERT INTO changes (id, version) VALUES (1, 1) "
+                    "ON CONFLICT (id) DO UPDATE SET version = version + 1")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _insert_sessions(self, connection: sqlite3.Connection,
+                         sessions: list[tuple[str | None, list[str], float | None]]
+                         ) -> list[str]:
+        """ Insert sessions inside already started write transaction """
+        next_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sessions").fetchone()[0]
+        names = []
+        for name, products, timestamp in sessions:
+            names.append(name or f"session_{next_id}")
+            connection.execute("INSERT INTO sessions (id, name, time) VALUES (?, ?, ?)",
+                               (next_id, names[-1], timestamp))
+            rows = []
+            for position, product in enumerate(products):
+                product_id = connection.execute(
+                    "INSERT INTO products (name, count) VALUES (?, 1) "
+                    "ON CONFLICT (name) DO UPDATE SET count = count + 1 RETURNING id",
+                    (product,)).fetchone()[0]
+                rows.append((next_id, position, product_id))
+            connection.executemany(
+                "INSERT INTO session_products (session_id, position, product_id) "
+                "VALUES (?, ?, ?)", rows)
+            next_id += 1
+        return names
+
+    def load_graph(self, session_times=None):
+        graph = {}
+        with self._transaction("DEFERRED") as connection:
+            rows = connection.execute(
+                "SELECT s.name, s.time, p.name FROM sessions AS s "
+                "LEFT JOIN session_products AS sp ON sp.session_id = s.id "
+                "LEFT JOIN products AS p ON p.id = sp.product_id "
+                "ORDER BY s.id, sp.position").fetchall()
+        for session, timestamp, product in rows:
+            products = graph.setdefault(session, [])
+            if product is not None:
+                products.append(product)
+            if session_times is not None and timestamp is not None:
+                session_times[session] = timestamp
+        return graph
+
+    def load_compact_graph(self):
+        # Names of sessions are unique in table, rows are added without dict
+        graph = CompactGraph()
+        for session, products in self.iter_sessions():
+            graph.add_session(products, session)
+        return graph
+
+    def iter_sessions(self, session_times=None):
+        for session, products, _ in self.iter_sessions_after(0, session_times):
+            yield session, products
+
+    def iter_sessions_after(self, position, session_times=None):
+        # Position is id of session. Separate connection, so rows
+        # can be read while this store writes
+        connection = sqlite3.connect(self.filename, timeout=30)
+        try:
+            rows = connection.execute(
+                "SELECT s.id, s.name, s.time, p.name FROM sessions AS s "
+                "LEFT JOIN session_products AS sp ON sp.session_id = s.id "
+                "LEFT JOIN products AS p ON p.id = sp.product_id "
+                "WHERE s.id > ? ORDER BY s.id, sp.position", (position,))
+            for (session_id, session, timestamp), session_rows in itertools.groupby(
+                    rows, key=lambda row: row[:3]):
+                if session_times is not None and timestamp is not None:
+                    session_times[session] = timestamp
+                yield session, [product for *_, product in session_rows
+                                if product is not None], session_id
+        finally:
+            connection.close()
+
+    def position(self):
+        with self._transaction("DEFERRED") as connection:
+            return connection.execute("SELECT COALESCE(MAX(id), 0) FROM sessions").fetchone()[0]
+
+    def save_graph(self, graph, session_times=None):
+        with self._transaction() as connection:
+            self._delete_all(connection)
+            self._insert_sessions(connection, [
+                (session, products, (session_times or {}).get(session))
+                for session, products in graph.items()
+            ])
+
+    def add_sessions(self, sessions):
+        with self._transaction() as connection:
+            return self._insert_sessions(connection, [
+                (None, products, timestamp) for products, timestamp in sessions
+            ])
+
+    def load_products_power(self):
+        with self._transaction("DEFERRED") as connection:
+            products_power = dict(connection.execute(
+                "SELECT name, count FROM products WHERE count > 0 ORDER BY id"))
+            sessions = connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return products_power, sessions
+
+    def rebuild_products_power(self):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE products SET count = (SELECT COUNT(*) FROM session_products "
+                "WHERE product_id = products.id)")
+        return self.load_products_power()
+
+    def check_products_power(self):
+        with self._transaction("DEFERRED") as connection:
+            wrong = connection.execute(
+                "SELECT COUNT(*) FROM products WHERE count != (SELECT COUNT(*) "
+                "FROM session_products WHERE product_id = products.id)").fetchone()[0]
+        return wrong == 0
+
+    def version(self):
+        with self._transaction("DEFERRED") as connection:
+            row = connection.execute("SELECT version FROM changes").fetchone()
+        return f"sqlite:{row[0] if row else 0}"
+
+    @staticmethod
+    def _delete_all(connection: sqlite3.Connection):
+        connection.execute("DELETE FROM session_products")
+        connection.execute("DELETE FROM sessions")
+        connection.execute("DELETE FROM products")
+
+    def clear(self):
+        with self._transaction() as connection:
+            self._delete_all(connection)
+
+
+def _stress_writer(filename: str, writer: int, sessions: int):
+    """ Write `sessions` sessions into SQLite store (for `stress_test`) """
+    store = SqliteStore(filename)
+    for i in range(sessions):
+        store.add_session([f"product_{writer}", f"product_{i % 7}"], float(i))
+
+def stress_test(filename: str, writers: int = 4, sessions: int = 25) -> bool:
+    """ Run `writers` processes, each adding `sessions` sessions into
+    one SQLite store in parallel, and check that nothing was lost
+
+    Args:
+        filename (str): name of database file
+        writers (int, optional): number of writer processes. Defaults to 4.
+        sessions (int, optional): sessions added by every writer. Defaults to 25.
+
+    Returns:
+        bool: True if all sessions were saved and products power is consistent
+
+    Example:
+    >>> import tempfile
+    >>> stress_test(os.path.join(tempfile.mkdtemp(), "graph.sqlite"), 4, 25)
+    True
+    """
+    import multiprocessing  # only stress test needs it, app starts without it
+
+    # Create database before writers start, so they dont race for schema
+    store = SqliteStore(filename)
+    processes = [multiprocessing.Process(target=_stress_writer, args=(filename, writer, sessions))
+                 for writer in range(writers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    graph = store.load_graph()
+    products_power, stored_sessions = store.load_products_power()
+    return len(graph) == stored_sessions == writers * sessions \
+        and sum(products_power.values()) == 2 * writers * sessions \
+        and store.check_products_power()
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -1,12 +1,27 @@
 """ UI module with main program loop """
 
 import curses
+import os
+import time
+
+from ui_tools.matrix import Matrix, FlatMatrix, draw_matrix_on_matrix, matrix_set_at
+from ui_tools.ui_toolbox import create_text_field_tile
+from ui_tools.renderer import DiffRenderer
+from typing import TYPE_CHECKING
 
-from ui_tools.matrix import (Matrix, create_matrix, fill_matrix,
-                             draw_matrix_on_screen, draw_matrix_on_matrix)
-from ui_tools.ui_toolbox import create_text_field, add_frame_to_matrix
 import graph_logic
-from graph_visualization_png import organise_graph, generate_graph_png
+import interning
+import dish_ranking
+import decay
+import session_store
+import instrumentation
+from background_worker import BackgroundWorker
+from visualization_backends import get_backend, LAYOUT_FILE
+
+# Modules with numpy are imported only by rankings that use them,
+# so "count" ranking and other modes start without numpy
+if TYPE_CHECKING:
+    import pagerank
 
 
 
@@ -15,8 +30,63 @@ DISH_BLOCK_WIDTH = 16
 
 UI_WIDTH = (DISH_BLOCK_WIDTH + 2) * DISH_PER_DISPLAY + 2
 UI_HEIGHT = 30
+# Number of most powerful nodes shown by Visualization button
+VISUALIZATION_TOP_NODES = 200
+# How long `getch` waits for key before UI checks background results (ms)
+INPUT_TIMEOUT = 100
 
+# Old graph file, rewritten fully on every purchase.
+# Now used only for one-time migration into `SESSION_LOG_FILE`
 GRAPH_FILE = "graph.json"
+# Append-only session log (json lines)
+SESSION_LOG_FILE = "graph.jsonl"
+# Binary snapshot of beginning of session log, graph is loaded from it
+# and only newer records of log are parsed (see graph_snapshot.py)
+SNAPSHOT_FILE = "graph.bin"
+# Time-decayed products power of all sessions from `SESSION_LOG_FILE`
+DECAYED_POWER_FILE = "decayed_power.json"
+# Aggregated products power of all sessions from `SESSION_LOG_FILE`
+PRODUCTS_POWER_FILE = "products_power.json"
+# Database for "sqlite" storage (several terminals can share it)
+SQLITE_FILE = "graph.sqlite"
+
+# Where sessions and aggregated products power are kept:
+# "jsonl" - `SESSION_LOG_FILE` and `PRODUCTS_POWER_FILE` (one terminal)
+# "sqlite" - `SQLITE_FILE` in WAL mode (several terminals)
+STORAGE_BACKENDS = ["jsonl", "sqlite"]
+STORE: session_store.SessionStore = session_store.JsonLogStore(
+    SESSION_LOG_FILE, PRODUCTS_POWER_FILE, GRAPH_FILE, SNAPSHOT_FILE)
+
+# Ways to calculate products power:
+# "count" - number of times product was bought
+# "pagerank" - PageRank of product in graph of sessions and products
+# "personalized" - PageRank personalized by products of last purchase
+# "decayed" - number of purchases, where old purchases count less
+RANKING_MODES = ["count", "pagerank", "personalized", "decayed"]
+# Engine keeps ranks between purchases to warm start next calculation,
+# created by first "pagerank" ranking
+PAGERANK_ENGINE: "pagerank.PageRankEngine | None" = None
+# Engine keeps loaded graph and index product -> sessions between purchases,
+# created by first "personalized" ranking
+PERSONALIZED_ENGINE: "pagerank.PersonalizedPageRank | None" = None
+# Number of sessions of `STORE` added to `PERSONALIZED_ENGINE` and position
+# of `STORE` after them. Sessions added after it (also by other terminals)
+# are added before next ranking
+PERSONALIZED_SESSIONS = 0
+PERSONALIZED_POSITION = 0
+# Ranking for "count" mode, updated by every purchase instead of full recalculation
+DISH_RANKING: dish_ranking.DishRanking | None = None
+# Number of sessions counted in `DISH_RANKING`. When other terminal adds
+# sessions to shared storage, it differs from stored one and ranking is rebuilt
+DISH_RANKING_SESSIONS = 0
+# Draws only cells changed since previous frame
+RENDERER = DiffRenderer()
+# Text shown on top of screen while background task of this kind runs
+TASK_LABELS = {
+    "ranking": "Перераховуємо рекомендації...",
+    "visualization": "Малюємо граф...",
+    "clear": "Обнуляємо граф...",
+}
 
 # Food data for testing
 TESTING_FOOD_DATA = [
@@ -75,34 +145,56 @@ def init_curses() -> curses.window:
 
     return stdscr
 
-def main_loop(testing_mode: bool=False):
+def main_loop(testing_mode: bool=False, ranking: str="count",
+              half_life: float=decay.DEFAULT_HALF_LIFE):
     """ Main loop of UI program """
     stdscr = init_curses()
 
     # Flag that indicate if program should still run
     ui_runs = True
     # Terminal screen matrix
-    screen_matrix = create_matrix(UI_WIDTH, UI_HEIGHT)
+    screen_matrix = FlatMatrix(UI_WIDTH, UI_HEIGHT)
     # Variable to hold food values for each food row
     typed_dishes = [[], [], [], []]
     dishes_dx = [0 for _ in range(len(typed_dishes))]
     cursor_position = (0, 0)
     selected_dishes = []
 
-    typed_dishes = get_sorted_dishes(selected_dishes, typed_dishes, testing_mode)
+    # Message about failed background task, shown until next key press
+    error_message = None
 
-    while ui_runs:
-        build_ui(screen_matrix, typed_dishes,
-                cursor_position, selected_dishes,
-                dishes_dx
-                )
-        draw_matrix_on_screen(stdscr, screen_matrix)
+    typed_dishes = get_sorted_dishes(selected_dishes, typed_dishes, testing_mode,
+                                     ranking, half_life)
+
+    # Purchases, visualization and clearing run in background thread one by one,
+    # while previous ranking stays on screen and keys are still handled
+    worker = BackgroundWorker()
+    stdscr.timeout(INPUT_TIMEOUT)
 
-        # Handle key input
+    while ui_runs:
+        with instrumentation.span("build_ui"):
+            build_ui(screen_matrix, typed_dishes,
+                    cursor_position, selected_dishes,
+                    dishes_dx
+                    )
+            if worker.busy:
+                draw_status(screen_matrix, TASK_LABELS[worker.pending[0]])
+            elif error_message:
+                draw_status(screen_matrix, error_message)
+        with instrumentation.span("draw_matrix_on_screen"):
+            cells_written = RENDERER.draw(stdscr, screen_matrix)
+        instrumentation.add_to_counter("frames")
+        instrumentation.add_to_counter("cells_written", cells_written)
+
+        # Handle key input (-1 if no key was pressed during `INPUT_TIMEOUT`)
         key = stdscr.getch()
+        if key != -1:
+            error_message = None
         # ESC key code - 27
         if key in [ord("q"), ord("Q"), 27]:
             ui_runs = False
+        elif key == curses.KEY_RESIZE:
+            RENDERER.invalidate()
         elif key in [ord("d"), ord("D"), curses.KEY_RIGHT]:
             cursor_position = (
                 cursor_position[0] + 1,
@@ -125,20 +217,30 @@ def main_loop(testing_mode: bool=False):
                 )
         elif key in [curses.KEY_ENTER, ord("\n"), ord(" ")]:
             if cursor_position == (0, 3): # Buy button
-                typed_dishes = get_sorted_dishes(selected_dishes,
-                                                 typed_dishes,
-                                                 testing_mode)
+                # Positions are resolved in ranking that is on screen now. It is
+                # a snapshot that no background task changes, so purchase queued
+                # behind other one still buys dishes user has selected
+                worker.submit("ranking", get_sorted_dishes,
+                              selected_dishes, typed_dishes,
+                              testing_mode, ranking, half_life)
                 selected_dishes = []
                 cursor_position = (0, 0)
             elif cursor_position == (1, 3): # Visualization button
-                show_visualization()
+                worker.submit("visualization", show_visualization)
             elif cursor_position == (2, 3): # Clear graph button
-                clear_graph()
+                worker.submit("clear", clear_graph)
             elif cursor_position in selected_dishes:
                 selected_dishes.remove(cursor_position)
             else:
                 selected_dishes.append(cursor_position[:])
 
+        # New ranking replaces old one at once, between frames
+        for kind, result, error in worker.poll():
+            if error is not None:
+                error_message = f"Помилка: {error}"
+            elif kind == "ranking":
+                typed_dishes = result
+
         cursor_position = (
                 min(cursor_position[0], len(typed_dishes[cursor_position[1]]) - 1),
                 cursor_position[1]
@@ -148,6 +250,9 @@ def main_loop(testing_mode: bool=False):
                             max(len(typed_dishes[cursor_position[1]]) - DISH_PER_DISPLAY, 0)
                             )
 
+    # Dont lose purchases that are still being saved
+    worker.close()
+
 
 
 def build_ui(screen_matrix: Matrix, typed_food: tuple[list[str], list[str], list[str]],
@@ -155,7 +260,8 @@ def build_ui(screen_matrix: Matrix, typed_food: tuple[list[str], list[str], list
              dishes_dx: list[int]
              ) -> Matrix:
     """ Build UI screen matrix """
-    fill_matrix(screen_matrix, " ")
+    # Empty framed screen, made once and copied on every frame
+    draw_matrix_on_matrix(create_text_field_tile("", UI_WIDTH, UI_HEIGHT), screen_matrix, 0, 0)
     for row, typed_food_row in enumerate(typed_food):
         for column in range(min(DISH_PER_DISPLAY, len(typed_food_row))):
             frame_symbol = None
@@ -166,22 +272,29 @@ def build_ui(screen_matrix: Matrix, typed_food: tuple[list[str], list[str], list
             elif row == 3:
                 frame_symbol = " "
             if row == 3:
-                dish_frame = create_text_field(
+                dish_frame = create_text_field_tile(
                     f"{typed_food_row[column + dishes_dx[row]]}",
                     DISH_BLOCK_WIDTH, 3, frame_symbol
                     )
             else:
-                dish_frame = create_text_field(
+                dish_frame = create_text_field_tile(
                     f"{column + dishes_dx[row] + 1}) {typed_food_row[column + dishes_dx[row]]}",
                     DISH_BLOCK_WIDTH, [3, 5, 7, 5, 3][column], frame_symbol
                     )
             draw_matrix_on_matrix(dish_frame, screen_matrix,
                                 column*(DISH_BLOCK_WIDTH+2) + 2, row*8 +2)
-    add_frame_to_matrix(screen_matrix)
 
+def draw_status(screen_matrix: Matrix, text: str):
+    """ Draw status text on top line of screen frame """
+    for i, char in enumerate(f" {text} "[:UI_WIDTH - 4]):
+        matrix_set_at(2 + i, 0, char, screen_matrix)
+
+@instrumentation.timed("get_sorted_dishes")
 def get_sorted_dishes(selected_dishes: list[str],
                typed_dishes: list[list[str], list[str], list[str]],
-               testing_mode: bool = False
+               testing_mode: bool = False,
+               ranking: str = "count",
+               half_life: float = decay.DEFAULT_HALF_LIFE
                ) -> list[list[str], list[str], list[str]]:
     """ Return list of sorted dishes with buttons """
     # Buttons row
@@ -191,44 +304,233 @@ def get_sorted_dishes(selected_dishes: list[str],
     if testing_mode:
         return TESTING_FOOD_DATA + buttons_row
 
-    graph = graph_logic.load_graph(GRAPH_FILE)
+    global DISH_RANKING_SESSIONS
+    with instrumentation.span("load_products_power"):
+        products_power, sessions = load_products_power()
+
+    with instrumentation.span("load_ranking"):
+        if ranking == "count":
+            count_ranking = get_dish_ranking(products_power, sessions)
+
+        if ranking == "personalized":
+            personalized_engine = get_personalized_engine(sessions)
+
+    now = time.time()
 
     if len(selected_dishes) != 0:
 
         # Creating names of selected dishes from indexes and sorted list
-        selected_dishes_names = []
-        for i, dish_type_list in enumerate(typed_dishes):
-            for j, dish_name in enumerate(dish_type_list):
-                if (j, i) in selected_dishes:
-                    selected_dishes_names.append(dish_name)
+        # (row by row, without walking every dish of every row)
+        selected_dishes_names = [
+            typed_dishes[i][j]
+            for j, i in sorted(selected_dishes, key=lambda position: position[::-1])
+        ]
 
         selected_products = graph_logic.dishes_to_products(selected_dishes_names)
-        graph_logic.add_session(graph, selected_products)
-        graph_logic.save_graph(graph, GRAPH_FILE)
-
-    # PageRank here
-    dishes_power = graph_logic.calculate_dishes_power(
-        graph_logic.calculate_products_power(graph)
-    )
-    new_typed_dishes = graph_logic.divide_dishes_by_type(
-        graph_logic.sort_dishes(dishes_power)
-    )
+        with instrumentation.span("add_session"):
+            STORE.add_session(selected_products, now)
+        graph_logic.update_products_power(products_power, selected_products)
+
+        with instrumentation.span("update_ranking"):
+            if ranking == "count":
+                count_ranking.apply_session(selected_products)
+                DISH_RANKING_SESSIONS += 1
+
+            # Without purchase personalized mode shows global counts
+            if ranking == "personalized":
+                # Number of sessions is read again, other terminals could add some too
+                personalized_engine = get_personalized_engine(load_products_power()[1])
+                products_power = personalized_engine.run(selected_products)
+
+    if ranking == "count":
+        # Views of ranking are copied: next purchase changes ranking in background
+        # thread, while UI thread still draws and resolves positions in this one
+        with instrumentation.span("sort_dishes"):
+            return [dishes[:] for dishes in count_ranking.typed_dishes()] + buttons_row
+
+    with instrumentation.span("products_power"):
+        if ranking == "pagerank":
+            products_power = get_pagerank_engine().run(load_compact_sessions())
+
+        # New session is counted while decayed power catches up with `STORE`
+        if ranking == "decayed":
+            products_power = load_decayed_power(half_life).power(now)
+
+    import dish_scoring
+    with instrumentation.span("calculate_dishes_power"):
+        dishes_power = dish_scoring.calculate_dishes_power(products_power)
+    # Only visible dishes are ranked right away, rest - when user scrolls
+    with instrumentation.span("sort_dishes"):
+        new_typed_dishes = graph_logic.top_dishes_by_type(dishes_power, DISH_PER_DISPLAY)
 
     return list(new_typed_dishes) + buttons_row
 
+def use_storage(backend: str):
+    """ Choose where sessions are kept, one of `STORAGE_BACKENDS`.
+    Both stores can be used from `BackgroundWorker` thread.
+
+    Example:
+    >>> import tempfile
+    >>> old_folder, old_menu = os.getcwd(), graph_logic.FOOD_DATABASE_FILE
+    >>> graph_logic.FOOD_DATABASE_FILE = os.path.abspath(old_menu)
+    >>> os.chdir(tempfile.mkdtemp())
+    >>> use_storage("sqlite")
+    >>> typed_dishes = get_sorted_dishes([], [])
+    >>> worker = BackgroundWorker()
+    >>> worker.submit("ranking", get_sorted_dishes, [(0, 0)], typed_dishes)
+    >>> worker.submit("sessions", lambda: load_products_power()[1])
+    >>> worker.submit("clear", clear_graph)
+    >>> worker.close()
+    >>> [(kind, result if kind == "sessions" else error) for kind, result, error in worker.poll()]
+    [('ranking', None), ('sessions', 1), ('clear', None)]
+    >>> use_storage("jsonl")
+    >>> os.chdir(old_folder)
+    >>> graph_logic.FOOD_DATABASE_FILE = old_menu
+    """
+    global STORE
+    if backend == "sqlite":
+        STORE = session_store.SqliteStore(SQLITE_FILE)
+    else:
+        STORE = session_store.JsonLogStore(SESSION_LOG_FILE, PRODUCTS_POWER_FILE,
+                                           GRAPH_FILE, SNAPSHOT_FILE)
+
+def load_sessions() -> graph_logic.Graph:
+    """ Load graph with all sessions from `STORE` """
+    with instrumentation.span("load_graph"):
+        return STORE.load_graph()
+
+def load_compact_sessions() -> interning.CompactGraph:
+    """ Load all sessions from `STORE` as `CompactGraph`, with snapshot
+    its arrays are read without translating sessions into names
+    """
+    with instrumentation.span("load_graph"):
+        return STORE.load_compact_graph()
+
+def iter_sessions() -> graph_logic.SessionStream:
+    """ Stream sessions from `STORE` without loading whole graph """
+    return STORE.iter_sessions()
+
+def get_dish_ranking(products_power: dict[str, int], sessions: int
+                     ) -> dish_ranking.DishRanking:
+    """ Return ranking of dishes for "count" mode.
+    It is built from `products_power` only first time, after menu was changed
+    or after other terminal added sessions
+    """
+    global DISH_RANKING, DISH_RANKING_SESSIONS
+    if DISH_RANKING is None or DISH_RANKING.menu is not graph_logic.get_menu_index() \
+            or DISH_RANKING_SESSIONS != sessions:
+        DISH_RANKING = dish_ranking.DishRanking(products_power)
+        DISH_RANKING_SESSIONS = sessions
+    return DISH_RANKING
+
+def get_pagerank_engine() -> "pagerank.PageRankEngine":
+    """ Return engine of "pagerank" mode, created by first call """
+    global PAGERANK_ENGINE
+    if PAGERANK_ENGINE is None:
+        import pagerank
+        PAGERANK_ENGINE = pagerank.PageRankEngine()
+    return PAGERANK_ENGINE
+
+def get_personalized_engine(sessions: int) -> "pagerank.PersonalizedPageRank":
+    """ Return engine of "personalized" mode with all `sessions` sessions
+    of `STORE`. It is loaded first time and after sessions were cleared,
+    otherwise only sessions added since previous call are read
+    """
+    global PERSONALIZED_ENGINE, PERSONALIZED_SESSIONS, PERSONALIZED_POSITION
+    if PERSONALIZED_ENGINE is None:
+        import pagerank
+        PERSONALIZED_ENGINE = pagerank.PersonalizedPageRank()
+    graph = PERSONALIZED_ENGINE.graph
+    if graph is not None and PERSONALIZED_SESSIONS < sessions:
+        for session, products, position in STORE.iter_sessions_after(PERSONALIZED_POSITION):
+            # Session stored while graph was loaded is already in it
+            if session not in graph.sessions:
+                PERSONALIZED_ENGINE.add_session(session, products)
+                PERSONALIZED_SESSIONS += 1
+            PERSONALIZED_POSITION = position
+    # Sessions were cleared (also by other terminal since last call)
+    if graph is None or PERSONALIZED_SESSIONS != sessions:
+        # Position is taken before loading, so no session is missed
+        PERSONALIZED_POSITION = STORE.position()
+        PERSONALIZED_ENGINE.load(load_compact_sessions())
+        PERSONALIZED_SESSIONS = len(PERSONALIZED_ENGINE.graph)
+    return PERSONALIZED_ENGINE
+
+def load_products_power() -> tuple[dict[str, int], int]:
+    """ Load aggregated products power and number of sessions """
+    return STORE.load_products_power()
+
+def rebuild_products_power() -> tuple[dict[str, int], int]:
+    """ Recalculate aggregated products power from all sessions """
+    return STORE.rebuild_products_power()
+
+def check_products_power() -> bool:
+    """ Check if aggregated products power is consistent with sessions """
+    return STORE.check_products_power()
+
+def load_decayed_power(half_life: float) -> decay.DecayedProductsPower:
+    """ Load time-decayed products power from `DECAYED_POWER_FILE` and add
+    sessions that were stored after it was saved (in other ranking modes
+    or by other terminals sharing `STORE`), then save it again.
+    If there is no file yet, it was made with other `half_life` or it has
+    more sessions than `STORE` (sessions were cleared), it is built from
+    all sessions. Only sessions after its `position` are read, so catching
+    up doesnt depend on number of sessions before them.
+    `DECAYED_POWER_FILE` is only a cache of `STORE`, so
+    terminals that replace it one after another dont lose sessions.
+    """
+    _, sessions = load_products_power()
+    decayed_power = None
+    if os.path.exists(DECAYED_POWER_FILE):
+        decayed_power = decay.DecayedProductsPower.load(DECAYED_POWER_FILE)
+        if decayed_power.half_life != half_life or decayed_power.position < 0 \
+                or not 0 <= decayed_power.sessions <= sessions:
+            decayed_power = None
+    added = 0
+    if decayed_power is not None and decayed_power.sessions < sessions:
+        added = add_stored_sessions(decayed_power)
+        # Position of other storage or of sessions that were cleared
+        # since file was saved doesnt reach all sessions
+        if decayed_power.sessions < sessions:
+            decayed_power = None
+    if decayed_power is None:
+        decayed_power = decay.DecayedProductsPower(half_life)
+        added = add_stored_sessions(decayed_power)
+    if added:
+        decayed_power.save(DECAYED_POWER_FILE)
+    return decayed_power
+
+def add_stored_sessions(decayed_power: decay.DecayedProductsPower) -> int:
+    """ Add sessions of `STORE` stored after position of `decayed_power`,
+    return number of added sessions
+    """
+    sessions = decayed_power.sessions
+    session_times = {}
+    for session, products, position in STORE.iter_sessions_after(decayed_power.position,
+                                                                 session_times):
+        decayed_power.add_session(products, session_times.pop(session, 0))
+        decayed_power.position = position
+    return decayed_power.sessions - sessions
+
 def show_visualization():
     """ Show visualization of current graph
     by calling visualization part of program
     """
-    generate_graph_png(organise_graph(graph_logic.load_graph(GRAPH_FILE)))
+    get_backend("png")(iter_sessions, "graph", top_nodes=VISUALIZATION_TOP_NODES,
+                       source_key=STORE.version())
 
 def clear_graph():
     """ Clear graph with preferences
     """
-    # Write mode create/overwrite file
-    with open("graph.json", "w", encoding="utf-8") as file:
-        # Write empty dictionary to `graph.json`
-        file.write("{\n}")
+    global DISH_RANKING, PERSONALIZED_ENGINE, PERSONALIZED_SESSIONS, PERSONALIZED_POSITION
+    STORE.clear()
+    for filename in [DECAYED_POWER_FILE, LAYOUT_FILE]:
+        if os.path.exists(filename):
+            os.remove(filename)
+    PERSONALIZED_ENGINE = None
+    PERSONALIZED_SESSIONS = 0
+    PERSONALIZED_POSITION = 0
+    DISH_RANKING = None
 
 if __name__ == "__main__":
     main_loop(testing_mode=True)
@@ -1,5 +1,7 @@
 """ Module that contain all tools to work Matrix """
 import curses
+import sys
+from array import array
 from typing import NewType
 
 # Just create new type shortcut called "Matrix"
@@ -17,6 +19,138 @@ Matrix = NewType("Matrix", list[list[str]])
 # [".", "e", "g", "g", "."],
 # [".", ".", ".", ".", "."]
 # ]
+#
+# All functions below also work with `FlatMatrix` - same screen kept
+# in one flat array of code points, which is much faster to fill and copy.
+
+# Codec that turns bytes of array('I') into string
+_CODE_POINTS_CODEC = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+
+
+class _FlatRow:
+    """ View of one row of `FlatMatrix`, so `matrix[y][x]` works as with lists """
+    __slots__ = ("matrix", "start")
+
+    def __init__(self, matrix: "FlatMatrix", y: int):
+        self.matrix = matrix
+        self.start = y * matrix.width
+
+    def __len__(self) -> int:
+        return self.matrix.width
+
+    def _index(self, x: int) -> int:
+        if x < 0:
+            x += self.matrix.width
+        if not 0 <= x < self.matrix.width:
+            raise IndexError("row index out of range")
+        return self.start + x
+
+    def __getitem__(self, x: int | slice) -> str | list[str]:
+        if isinstance(x, slice):
+            return list(str(self))[x]
+        return chr(self.matrix.cells[self._index(x)])
+
+    def __setitem__(self, x: int, value: str):
+        self.matrix.cells[self._index(x)] = ord(value)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __str__(self) -> str:
+        return self.matrix.row_text(self.start // self.matrix.width)
+
+
+class FlatMatrix:
+    """ Matrix kept in one flat array of code points, row after row.
+    Whole rows are filled and copied with array slices instead
+    of setting cells one by one.
+
+    Attributes:
+        width (int): number of columns
+        height (int): number of rows
+        cells (array): code point of every cell, cell (x, y) is at y * width + x
+
+    Examples:
+    >>> matrix = FlatMatrix(4, 2, ".")
+    >>> matrix_set_at(1, 0, "e", matrix)
+    >>> matrix[1][3] = "g"
+    >>> matrix.to_rows()
+    [['.', 'e', '.', '.'], ['.', '.', '.', 'g']]
+    >>> matrix.blit(FlatMatrix.from_rows([["a", "b"], ["c", "d"]]), 3, 1, True)
+    >>> matrix.row_text(1), matrix_get_at(3, 1, matrix)
+    ('...a', 'a')
+    """
+    __slots__ = ("width", "height", "cells")
+
+    def __init__(self, width: int, height: int, fill_symbol: str = " "):
+        self.width = width
+        self.height = height
+        self.cells = array("I", [ord(fill_symbol)]) * (width * height)
+
+    @classmethod
+    def from_rows(cls, rows: Matrix) -> "FlatMatrix":
+        """ Create flat matrix with the same tiles as list matrix `rows` """
+        matrix = cls(len(rows[0]), len(rows))
+        matrix.cells = array("I", [ord(symbol) for row in rows for symbol in row])
+        return matrix
+
+    def to_rows(self) -> Matrix:
+        """ Return tiles as list matrix """
+        return [list(self.row_text(y)) for y in range(self.height)]
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __getitem__(self, y: int) -> _FlatRow:
+        if y < 0:
+            y += self.height
+        if not 0 <= y < self.height:
+            raise IndexError("matrix index out of range")
+        return _FlatRow(self, y)
+
+    def __iter__(self):
+        return (_FlatRow(self, y) for y in range(self.height))
+
+    def __repr__(self) -> str:
+        return f"FlatMatrix.from_rows({self.to_rows()!r})"
+
+    def row_text(self, y: int) -> str:
+        """ Return row `y` as string """
+        start = y * self.width
+        return self.cells[start:start + self.width].tobytes().decode(_CODE_POINTS_CODEC)
+
+    def fill(self, fill_value: str):
+        """ Set all tiles to `fill_value` """
+        self.cells = array("I", [ord(fill_value)]) * (self.width * self.height)
+
+    def contains(self, source: "FlatMatrix", d_x: int, d_y: int) -> bool:
+        """ Check if `source` biased by (`d_y`, `d_x`) fits into matrix """
+        return 0 <= d_x and d_x + source.width <= self.width \
+            and 0 <= d_y and d_y + source.height <= self.height
+
+    def blit(self, source: "FlatMatrix", d_x: int, d_y: int, clip: bool = False):
+        """ Copy `source` onto matrix biased by (`d_y`, `d_x`), row slice by row slice
+
+        Args:
+            source (FlatMatrix): source of new tiles
+            d_x (int): delta x position of `source`
+            d_y (int): delta y position of `source`
+            clip (bool, optional): skip tiles out of matrix boundaries
+                instead of raising exception. Defaults to False.
+        """
+        if not clip and not self.contains(source, d_x, d_y):
+            raise ValueError(f"Matrix of size (w: {source.width}, h: {source.height}) "
+                             f"at (x:{d_x}, y:{d_y}) is out of matrix size "
+                             f"(w: {self.width}, h: {self.height})")
+        left, right = max(0, -d_x), min(source.width, self.width - d_x)
+        if left >= right:
+            return
+        for source_y in range(max(0, -d_y), min(source.height, self.height - d_y)):
+            start = (source_y + d_y) * self.width + d_x
+            source_start = source_y * source.width
+            self.cells[start + left:start + right] = \
+                source.cells[source_start + left:source_start + right]
+
 
 def create_matrix(width: int, height: int, fill_symbol=" ") -> Matrix:
     """ Create matrix of size `width`x`height`
@@ -75,6 +209,9 @@ def fill_matrix(matrix: Matrix, fill_value: str):
     >>> matrix
     [['.', '.', '.'], ['.', '.', '.']]
     """
+    if isinstance(matrix, FlatMatrix):
+        matrix.fill(fill_value)
+        return
     for y in range(get_matrix_height(matrix)):
         for x in range(get_matrix_width(matrix)):
             matrix[y][x] = fill_value
@@ -171,6 +308,12 @@ def draw_matrix_on_matrix(source_matrix: Matrix, destination_matrix: Matrix,
         ...
     ValueError: Coordinates (x:0, y:-1) are out of matrix size (w: 3, h: 2)
     """
+    # Flat matrices are copied by row slices. If source doesnt fit and errors
+    # are not silent, fall back to cell by cell copy to raise the same error
+    if isinstance(source_matrix, FlatMatrix) and isinstance(destination_matrix, FlatMatrix) \
+            and (silent_erros or destination_matrix.contains(source_matrix, d_x, d_y)):
+        destination_matrix.blit(source_matrix, d_x, d_y, clip=True)
+        return
     for source_y in range(get_matrix_height(source_matrix)):
         for source_x in range(get_matrix_width(source_matrix)):
             matrix_set_at(
@@ -192,12 +335,21 @@ def draw_matrix_on_screen(stdscr: curses.window, matrix: Matrix, reverse_y: bool
             When ser to True, (0, 0) will be at bottom-left corner.
             Defaults to False.
     """
-    if reverse_y:
-        for y, row in enumerate(matrix):
-            stdscr.addstr(get_matrix_height(matrix) - y - 1, 0, "".join(row))
-    else:
-        for y, row in enumerate(matrix):
-            stdscr.addstr(y, 0, "".join(row))
+    for y in range(get_matrix_height(matrix)):
+        screen_y = get_matrix_height(matrix) - y - 1 if reverse_y else y
+        stdscr.addstr(screen_y, 0, matrix_row_text(matrix, y))
+
+def matrix_row_text(matrix: Matrix, y: int) -> str:
+    """ Return row `y` of matrix as string
+
+    >>> matrix_row_text([['1', '2', '3'], ['a', 'b', 'c']], 1)
+    'abc'
+    >>> matrix_row_text(FlatMatrix.from_rows([['1', '2', '3'], ['a', 'b', 'c']]), 0)
+    '123'
+    """
+    if isinstance(matrix, FlatMatrix):
+        return matrix.row_text(y)
+    return "".join(matrix[y])
 
 if __name__ == "__main__":
     import doctest
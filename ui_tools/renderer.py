@@ -0,0 +1,119 @@
+""" Module with double-buffered renderer of matrices on curses screen """
+import curses
+
+from ui_tools.matrix import Matrix, get_matrix_height, matrix_row_text
+
+
+def changed_runs(previous: Matrix, current: Matrix, max_gap: int = 3
+                 ) -> list[tuple[int, int, str]]:
+    """ Find runs of cells that differ between two matrices of the same size.
+    Runs in one row separated by at most `max_gap` unchanged cells are joined,
+    because moving cursor costs about as much as rewriting few cells.
+
+    Args:
+        previous (Matrix): matrix that is on screen now
+        current (Matrix): new matrix
+        max_gap (int, optional): unchanged cells allowed inside run. Defaults to 3.
+
+    Returns:
+        list[tuple[int, int, str]]: (y, x, text) of every run
+
+    Examples:
+    >>> changed_runs([list("abcdefgh")], [list("aXcdefYh")], max_gap=1)
+    [(0, 1, 'X'), (0, 6, 'Y')]
+    >>> changed_runs([list("abcdefgh")], [list("aXcdeYgh")], max_gap=3)
+    [(0, 1, 'XcdeY')]
+    >>> changed_runs([list("ab"), list("cd")], [list("ab"), list("cd")])
+    []
+    """
+    runs = []
+    for y, (old_row, new_row) in enumerate(zip(previous, current)):
+        if old_row == new_row:
+            continue
+        start = end = None
+        for x, (old, new) in enumerate(zip(old_row, new_row)):
+            if old == new:
+                continue
+            if start is not None and x - end > max_gap + 1:
+                runs.append((y, start, "".join(new_row[start:end])))
+                start = None
+            if start is None:
+                start = x
+            end = x + 1
+        runs.append((y, start, "".join(new_row[start:end])))
+    return runs
+
+
+class DiffRenderer:
+    """ Draws matrices on curses screen, keeping copy of last drawn frame
+    and writing only runs of cells that changed since it.
+    First frame and frame of other size are drawn fully.
+
+    Attributes:
+        max_gap (int): unchanged cells allowed inside one run
+        frames (int): number of drawn frames
+        cells_written (int): cells written by last frame
+        total_cells_written (int): cells written by all frames
+
+    Example:
+    >>> class Screen:
+    ...     def addstr(self, y, x, text):
+    ...         print(y, x, text)
+    >>> renderer = DiffRenderer()
+    >>> renderer.draw(Screen(), [list("abc"), list("def")])
+    0 0 abc
+    1 0 def
+    6
+    >>> renderer.draw(Screen(), [list("abc"), list("dXf")])
+    1 1 X
+    1
+    >>> renderer.frames, renderer.total_cells_written
+    (2, 7)
+    """
+    def __init__(self, max_gap: int = 3):
+        self.max_gap = max_gap
+        self.frames = 0
+        self.cells_written = 0
+        self.total_cells_written = 0
+        self._previous = None
+
+    def invalidate(self):
+        """ Forget last frame, so next one is drawn fully
+        (after screen was cleared or resized)
+        """
+        self._previous = None
+
+    def draw(self, stdscr: curses.window, matrix: Matrix) -> int:
+        """ Draw `matrix` on screen, writing only changed cells
+
+        Args:
+            stdscr (curses.window): curses window object to draw on
+            matrix (Matrix): matrix to draw, (0, 0) at top-left corner
+
+        Returns:
+            int: number of cells written
+        """
+        # Rows are compared as strings, it works the same for list and flat matrices
+        rows = [matrix_row_text(matrix, y) for y in range(get_matrix_height(matrix))]
+        previous = self._previous
+        if previous is None or len(previous) != len(rows) \
+                or len(previous[0]) != len(rows[0]):
+            runs = [(y, 0, row) for y, row in enumerate(rows)]
+        else:
+            runs = changed_runs(previous, rows, self.max_gap)
+
+        cells_written = 0
+        for y, x, text in runs:
+            stdscr.addstr(y, x, text)
+            cells_written += len(text)
+
+        self._previous = rows
+        self.frames += 1
+        self.cells_written = cells_written
+        self.total_cells_written += cells_written
+        return cells_written
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -1,9 +1,14 @@
 """ Module that contain all thing needed for creating ui """
+import functools
+
 from ui_tools.matrix import (
-    Matrix, get_matrix_width, get_matrix_height, matrix_set_at,
+    Matrix, FlatMatrix, get_matrix_width, get_matrix_height, matrix_set_at,
     create_matrix
 )
 
+# Number of text fields remembered by `create_text_field_tile`
+TILE_CACHE_SIZE = 256
+
 def add_frame_to_matrix(matrix: Matrix, frame_symbol: str | None=None):
     """ Draw frame on matrix
     
@@ -73,3 +78,19 @@ def create_text_field(text: str, width: int, height: int, frame_symbol: str | No
         matrix_set_at(1 + delta_x + i, center_y, char, field_matrix)
 
     return field_matrix
+
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def create_text_field_tile(text: str, width: int, height: int,
+                           frame_symbol: str | None=None) -> FlatMatrix:
+    """ Same text field as `create_text_field`, but as `FlatMatrix`.
+    Last `TILE_CACHE_SIZE` tiles are remembered, so UI doesnt rebuild
+    the same fields every frame. Tile is shared, dont change it.
+
+    Examples:
+    >>> tile = create_text_field_tile("Meow", 8, 3)
+    >>> [tile.row_text(y) for y in range(3)]
+    ['┌──────┐', '│ Meow │', '└──────┘']
+    >>> create_text_field_tile("Meow", 8, 3) is tile
+    True
+    """
+    return FlatMatrix.from_rows(create_text_field(text, width, height, frame_symbol))
@@ -0,0 +1,48 @@
+""" Module with registry of visualization backends. Backends are imported
+only when they are used, so program starts without loading Manim and Graphviz.
+"""
+
+import importlib
+
+# File with node positions of animation, see `animation_layout.AnimationLayout`
+LAYOUT_FILE = "animation_layout.json"
+
+# Kinds of edges of png visualization, see `graph_visualization_png.weighted_edges`
+EDGE_MODES = ["session", "product"]
+
+# Backend name -> (module, function)
+BACKENDS = {
+    "png": ("render_cache", "render_graph"),
+    "animation": ("graph_visualization_animation", "create_scene"),
+}
+
+
+def get_backend(name: str):
+    """ Import module of backend `name` and return its function
+
+    Args:
+        name (str): name of backend, one of `BACKENDS`
+
+    Returns:
+        Callable: function of backend
+
+    Example:
+    >>> BACKENDS["double"] = ("operator", "mul")
+    >>> get_backend("double")(2, 3)
+    6
+    >>> get_backend("meow")
+    Traceback (most recent call last):
+        ...
+    ValueError: Unknown visualization backend 'meow', expected one of: png, animation, double
+    >>> del BACKENDS["double"]
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown visualization backend {name!r}, "
+                         f"expected one of: {', '.join(BACKENDS)}")
+    module, function = BACKENDS[name]
+    return getattr(importlib.import_module(module), function)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())